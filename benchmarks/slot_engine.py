@@ -0,0 +1,218 @@
+"""
+Micro-benchmarks for the slot engine and schedule exception resolution.
+
+Times the pure-computation parts of slot lookup on synthetic data, with no
+database: compiling the exception index, resolving rules for a date,
+applying modification rules to a timetable, generating the slot grid and
+filtering out a heavily booked day.
+
+Record a baseline once, then compare later runs against it:
+
+    python -m benchmarks.slot_engine --save
+    python -m benchmarks.slot_engine --check
+
+`--check` exits with status 1 if any case is slower than the baseline by
+more than the tolerance.
+"""
+
+import argparse
+import datetime
+import json
+import random
+import sys
+import timeit
+from pathlib import Path
+
+from database.models import ScheduleException, TimetableSlot
+from services.exception_index import ScheduleExceptionIndex
+from services.schedule_service import (
+    _generate_staggered_slots,
+    _resolve_time_blocks,
+    slot_position,
+)
+
+BASELINE_PATH = Path(__file__).with_name("slot_engine_baseline.json")
+DEFAULT_TOLERANCE = 0.25
+
+# Far enough ahead that no generated slot is filtered out as past
+START_DATE = datetime.date.today() + datetime.timedelta(days=365)
+WINDOWS = range(1, 4)
+
+
+def make_timetable(blocks_per_day: int) -> list[TimetableSlot]:
+    """Builds a week of back-to-back 45-minute blocks for every window."""
+    slots = []
+    for window in WINDOWS:
+        for day_of_week in range(5):
+            start = datetime.datetime.combine(START_DATE, datetime.time(9, 0))
+            for _ in range(blocks_per_day):
+                end = start + datetime.timedelta(minutes=45)
+                slots.append(
+                    TimetableSlot(
+                        day_of_week=day_of_week,
+                        start_time=start.time(),
+                        end_time=end.time(),
+                        is_active=True,
+                        window_number=window,
+                    )
+                )
+                start = end + datetime.timedelta(minutes=15)
+    return slots
+
+
+def make_exceptions(count: int, rng: random.Random) -> list[ScheduleException]:
+    """Builds overlapping rules of every kind over a semester-long range."""
+    exceptions = []
+    for i in range(count):
+        start_date = START_DATE + datetime.timedelta(days=rng.randrange(120))
+        kind = rng.random()
+        exc = ScheduleException(
+            exception_id=i + 1,
+            description=f"Synthetic rule {i}",
+            start_date=start_date,
+            end_date=(
+                None
+                if rng.random() < 0.05
+                else start_date + datetime.timedelta(days=rng.randrange(60))
+            ),
+            is_active=True,
+            priority=rng.randrange(10),
+            is_non_working=kind < 0.05,
+            block_others_if_years_mismatch=False,
+        )
+        if kind >= 0.05:
+            exc.target_days_of_week = rng.sample(range(5), rng.randint(1, 3))
+            exc.target_start_time = datetime.time(9 + rng.randrange(8), 0)
+            exc.new_start_time = datetime.time(9 + rng.randrange(8), 15)
+            exc.new_end_time = datetime.time(10 + rng.randrange(8), 0)
+            exc.start_window_override = rng.choice([None, 1, 2, 3])
+        if kind > 0.9:
+            exc.allowed_years = rng.sample(range(1, 7), rng.randint(1, 3))
+            exc.block_others_if_years_mismatch = rng.random() < 0.3
+        exceptions.append(exc)
+    return exceptions
+
+
+def build_cases(rules: int, blocks_per_day: int) -> dict:
+    """Returns the benchmark cases as name -> (callable, calls per run)."""
+    rng = random.Random(42)
+    timetable = make_timetable(blocks_per_day)
+    exceptions = make_exceptions(rules, rng)
+    dates = [START_DATE + datetime.timedelta(days=i) for i in range(150)]
+
+    index = ScheduleExceptionIndex()
+    index.compile(exceptions)
+
+    window_slots = [slot for slot in timetable if slot.window_number == 1]
+    working_dates = [date for date in dates if date.weekday() < 5]
+    target_date = working_dates[0]
+    modifiers = index.rules_for(target_date, 1).modifiers
+    time_blocks, start_window = _resolve_time_blocks(
+        modifiers, window_slots, target_date
+    )
+    potential_slots = _generate_staggered_slots(
+        target_date, time_blocks, start_window, 1
+    )
+    # Nine in ten slots of the day are already taken
+    booked = {slot_position(slot)[1] for slot in potential_slots if rng.random() < 0.9}
+
+    def compile_index():
+        ScheduleExceptionIndex().compile(exceptions)
+
+    def resolve_rules_cold():
+        index._memo = {}
+        for date in dates:
+            index.rules_for(date, 1)
+
+    def resolve_rules_warm():
+        for date in dates:
+            index.rules_for(date, 1)
+
+    def resolve_time_blocks():
+        for date in working_dates:
+            _resolve_time_blocks(index.rules_for(date, 1).modifiers, window_slots, date)
+
+    def generate_slots():
+        _generate_staggered_slots(target_date, time_blocks, start_window, 1)
+
+    def filter_booked_day():
+        [slot for slot in potential_slots if slot_position(slot)[1] not in booked]
+
+    return {
+        "compile_index": (compile_index, 1),
+        "resolve_rules_cold": (resolve_rules_cold, len(dates)),
+        "resolve_rules_warm": (resolve_rules_warm, len(dates)),
+        "resolve_time_blocks": (resolve_time_blocks, len(working_dates)),
+        "generate_slots": (generate_slots, 1),
+        "filter_booked_day": (filter_booked_day, 1),
+    }
+
+
+def measure(cases: dict, repeat: int) -> dict[str, float]:
+    """Returns the best time per call of each case, in microseconds."""
+    results = {}
+    for name, (func, calls) in cases.items():
+        timer = timeit.Timer(func)
+        number, _ = timer.autorange()
+        best = min(timer.repeat(repeat=repeat, number=number)) / number
+        results[name] = best / calls * 1_000_000
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Prints a comparison table and returns the names of regressed cases."""
+    regressions = []
+    print(f"{'case':<22}{'baseline us':>14}{'current us':>14}{'change':>10}")
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            print(f"{name:<22}{'-':>14}{current:>14.2f}{'new':>10}")
+            continue
+        change = current / previous - 1
+        flag = ""
+        if change > tolerance:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<22}{previous:>14.2f}{current:>14.2f}{change:>+10.1%}{flag}")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rules", type=int, default=300)
+    parser.add_argument("--blocks-per-day", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=DEFAULT_TOLERANCE,
+        help="Allowed slowdown as a fraction of the baseline",
+    )
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--save", action="store_true", help="Record a new baseline")
+    mode.add_argument("--check", action="store_true", help="Fail on regressions")
+    args = parser.parse_args()
+
+    results = measure(build_cases(args.rules, args.blocks_per_day), args.repeat)
+
+    if args.save or not args.baseline.exists():
+        for name, current in results.items():
+            print(f"{name:<22}{current:>14.2f} us")
+        if args.save:
+            args.baseline.write_text(json.dumps(results, indent=2) + "\n")
+            print(f"\nBaseline saved to {args.baseline}")
+        elif args.check:
+            print(f"\nNo baseline at {args.baseline}, run with --save first")
+            sys.exit(1)
+        return
+
+    baseline = json.loads(args.baseline.read_text())
+    regressions = compare(results, baseline, args.tolerance)
+    if args.check and regressions:
+        print(f"\nRegressed beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,23 @@
 import asyncio
+import signal
 import urllib
+from functools import partial
 from zoneinfo import ZoneInfo
 
 from aiogram import Bot, Dispatcher
 from aiogram.client.bot import DefaultBotProperties
 from aiogram.fsm.storage.redis import DefaultKeyBuilder, RedisStorage
 from aiogram.utils.callback_answer import CallbackAnswerMiddleware
-from aiogram.webhook.aiohttp_server import SimpleRequestHandler
 from aiogram_dialog import setup_dialogs
 from aiohttp import web
 from loguru import logger
-from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from sqlalchemy.ext.asyncio import async_sessionmaker
 from sqlalchemy import text
 
 from config_data import config
-from database.base import Base
+from database.engine import create_engines
+from database.session import create_session_maker
 from dialogs import (
     admin_dialog,
     booking_management_dialog,
@@ -24,82 +27,129 @@ from dialogs import (
 from handlers import commands_router, messages_router
 from keyboards import set_main_menu
 from middlewares import (
+    BotApiMetricsMiddleware,
     DbSessionMiddleware,
     GetLangMiddleware,
-    MessageThrottlingMiddleware,
+    HandlerMetricsMiddleware,
+    ReleaseReadOnlySessionMiddleware,
+    ThrottlingMiddleware,
+    UpdateMetricsMiddleware,
 )
 from services import (
-    populate_initial_faculties,
-    populate_initial_lastday,
-    populate_initial_timetable,
+    REFERENCE_DATA_TOPIC,
+    AvailabilityCache,
+    HealthMonitor,
+    IdempotencyGuard,
+    InstrumentedConnection,
+    LeasedRedisEventIsolation,
+    QueuedRequestHandler,
+    RateLimiter,
+    ReadYourWritesGuard,
+    SlotHolds,
+    UpdateDeduplicator,
+    UserProfileCache,
+    instrument_engine,
+    invalidation_bus,
+    bootstrap_database,
+    ensure_webhook,
     setup_logger,
+    tracer,
 )
 
 __version__ = "2.0.0"
 
 
-async def on_startup(bot: Bot, session_maker: async_sessionmaker) -> None:
-    """A function that is executed when the bot starts."""
-    # --- Create tables and populate initial data ---
-    engine = session_maker.kw["bind"]
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
-
-    await populate_initial_faculties(session_maker)
-    await populate_initial_timetable(session_maker)
-    await populate_initial_lastday(session_maker)
-
-    # --- Set webhook if URL is provided ---
-    if config.webhook.base_url:
-        webhook_url = f"{config.webhook.base_url}{config.webhook.path}"
-        await bot.set_webhook(url=webhook_url)
-        logger.info(f"Webhook set to {webhook_url}")
-    else:
-        logger.info("Webhook not set, running in polling mode.")
+async def on_startup(bot: Bot, session_maker: async_sessionmaker) -> bool:
+    """
+    A function that is executed when the bot starts.
+    Returns True if this replica created or seeded the database.
+    """
+    # --- Create tables and populate initial data, once per schema version ---
+    bootstrapped = await bootstrap_database(session_maker)
 
     # --- Set main menu commands ---
     await set_main_menu(bot)
+    return bootstrapped
 
 
 async def on_shutdown(bot: Bot) -> None:
-    """A function that is executed when the bot is shut down."""
+    """
+    A function that is executed when the bot is shut down.
+    The webhook stays registered, other replicas keep serving it.
+    """
     logger.info("Bot is shutting down...")
-    await bot.delete_webhook(drop_pending_updates=True)
-    logger.info("Webhook deleted.")
+    await invalidation_bus.stop()
+    tracer.close()
 
 
 async def main() -> None:
     """Initializes and starts the bot."""
     setup_logger("INFO")
+    tracer.configure(config.tracing)
 
     logger.info(f"Starting DAS Payment Bot version {__version__}")
 
     # --- Initializing Bot and Storages ---
     bot = Bot(token=config.bot.token, default=DefaultBotProperties(parse_mode="HTML"))
+    # Read-only updates give their DB connection back before calling Telegram
+    bot.session.middleware(ReleaseReadOnlySessionMiddleware())
+    # Registered last, so it times the API call alone
+    bot.session.middleware(BotApiMetricsMiddleware())
 
     bot_storage = RedisStorage.from_url(
         f"redis://{config.redis.user}:{urllib.parse.quote_plus(config.redis.password)}@{config.redis.host}:{config.redis.port}/{config.redis.bot_database}",
+        connection_kwargs={"connection_class": InstrumentedConnection},
         key_builder=DefaultKeyBuilder(with_destiny=True),
     )
     middleware_storage = RedisStorage.from_url(
         f"redis://{config.redis.user}:{urllib.parse.quote_plus(config.redis.password)}@{config.redis.host}:{config.redis.port}/{config.redis.middleware_database}",
+        connection_kwargs={"connection_class": InstrumentedConnection},
     )
 
-    dp = Dispatcher(storage=bot_storage)
+    # Updates of one user are serialized across replicas, not only per process
+    dp = Dispatcher(
+        storage=bot_storage,
+        events_isolation=LeasedRedisEventIsolation(
+            bot_storage.redis, key_builder=bot_storage.key_builder
+        ),
+    )
+    # Shared across replicas, so the time picker is served from Redis
+    dp["availability_cache"] = AvailabilityCache(middleware_storage.redis)
+    dp["slot_holds"] = SlotHolds(middleware_storage.redis)
+    # Double taps on confirm buttons get the first tap's outcome
+    dp["idempotency"] = IdempotencyGuard(middleware_storage.redis)
+    user_profiles = UserProfileCache(middleware_storage.redis)
+    dp["user_profiles"] = user_profiles
 
     # --- Database Initialization ---
-    engine = create_async_engine(
-        url=config.db.url,
-        echo=False,
-        pool_pre_ping=True,  # Check connection before use
+    engine, replica_engine = create_engines(config.db)
+    instrument_engine(engine)
+    if replica_engine:
+        instrument_engine(replica_engine)
+    # Read-only queries go to the replica if there is one, see database/session.py
+    ryw_guard = (
+        ReadYourWritesGuard(middleware_storage.redis) if replica_engine else None
     )
-    session_maker = async_sessionmaker(engine, expire_on_commit=False)
+    session_maker = create_session_maker(engine, replica_engine)
 
     # --- Middlewares Setup ---
-    dp.update.middleware(DbSessionMiddleware(session_pool=session_maker))
-    dp.update.middleware(GetLangMiddleware())
-    dp.message.middleware(MessageThrottlingMiddleware(storage=middleware_storage))
+    # Metrics wrap everything else, throttled updates included
+    dp.update.middleware(UpdateMetricsMiddleware(sql_report=config.sql_report))
+    # Throttling goes next, so rejected updates never get a DB session
+    dp.update.middleware(
+        ThrottlingMiddleware(
+            limiter=RateLimiter(middleware_storage.redis),
+            limits=config.throttling,
+            admin_ids=config.bot.admin_ids,
+        )
+    )
+    dp.update.middleware(
+        DbSessionMiddleware(session_pool=session_maker, guard=ryw_guard)
+    )
+    dp.update.middleware(GetLangMiddleware(profiles=user_profiles))
     dp.callback_query.middleware(CallbackAnswerMiddleware())
+    dp.message.middleware(HandlerMetricsMiddleware())
+    dp.callback_query.middleware(HandlerMetricsMiddleware())
 
     # --- Routers and Dialogs Setup ---
     dp.include_router(commands_router)
@@ -112,7 +162,11 @@ async def main() -> None:
     setup_dialogs(dp)
 
     # --- Bot Startup ---
-    await on_startup(bot, session_maker)
+    bootstrapped = await on_startup(bot, session_maker)
+    await invalidation_bus.start(middleware_storage.redis)
+    if bootstrapped:
+        # Seeding may have filled reference tables other replicas already cached
+        await invalidation_bus.publish(REFERENCE_DATA_TOPIC)
     dp.shutdown.register(on_shutdown)
 
     if config.webhook.base_url:
@@ -132,46 +186,88 @@ async def main() -> None:
                 )
         
 
+        # --- Dependency checks, run in the background by the health monitor ---
+        async def ping_database(db_engine):
+            async with db_engine.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+
+        health = HealthMonitor()
+        # Every replica calls Telegram, so it is checked less often
+        health.add("telegram", bot.get_me, interval=60)
+        health.add("database", partial(ping_database, engine))
+        if replica_engine:
+            health.add("database_replica", partial(ping_database, replica_engine))
+        health.add("redis", bot_storage.redis.ping)
+        await health.start()
+
         async def readiness_probe(request):
             """
-            Readiness probe endpoint that checks connections to all critical services.
+            Readiness probe endpoint, answered from the last dependency checks.
             """
-            try:
-                # 1. Check Telegram API connection
-                await bot.get_me()
-
-                # 2. Check Database connection by executing a simple query
-                async with session_maker() as session:
-                    await session.execute(text("SELECT 1"))
-
-                # 3. Check Redis connection
-                await bot_storage.redis.ping()
-
-                logger.debug("Readiness probe successful.")
+            if health.ready:
                 return web.Response(text="OK", status=200)
-            except Exception as e:
-                logger.error(f"Readiness probe failed: {e.__class__.__name__} - {e}")
-                return web.Response(
-                    text=f"Service Unavailable: {e.__class__.__name__}", status=503
-                )
+            failing = [name for name, status in health.status.items() if not status.healthy]
+            return web.Response(
+                text=f"Service Unavailable: {', '.join(failing) or 'stale checks'}",
+                status=503,
+            )
+
+        async def health_details(request):
+            """Status and latency of each dependency as of its last check."""
+            return web.json_response(
+                health.details(), status=200 if health.ready else 503
+            )
+
+        async def metrics(request):
+            """Prometheus metrics of this replica."""
+            return web.Response(
+                body=generate_latest(), headers={"Content-Type": CONTENT_TYPE_LATEST}
+            )
 
         app = web.Application()
         app.router.add_get("/health/live", liveness_probe)
         app.router.add_get("/health/ready", readiness_probe)
+        app.router.add_get("/health/details", health_details)
+        app.router.add_get("/metrics", metrics)
 
-        webhook_requests_handler = SimpleRequestHandler(
+        # Updates are acknowledged at once and processed in order per chat
+        webhook_requests_handler = QueuedRequestHandler(
             dispatcher=dp,
             bot=bot,
+            workers=config.webhook.workers,
+            max_pending=config.webhook.max_pending,
+            # A redelivered update runs once, whichever replica receives it
+            dedup=UpdateDeduplicator(middleware_storage.redis),
         )
         webhook_requests_handler.register(app, path=config.webhook.path)
 
-        runner = web.AppRunner(app)
+        # In-flight requests only wait for queue space, see QueuedRequestHandler
+        runner = web.AppRunner(app, shutdown_timeout=10)
         await runner.setup()
         site = web.TCPSite(runner, host=config.webhook.host, port=config.webhook.port)
         await site.start()
 
-        # Keep the server running
-        await asyncio.Event().wait()
+        # Only sets the webhook if its settings changed, once for all replicas
+        await ensure_webhook(
+            bot,
+            middleware_storage.redis,
+            f"{config.webhook.base_url}{config.webhook.path}",
+            allowed_updates=dp.resolve_used_update_types(),
+        )
+
+        # Keep the server running until Kubernetes stops the pod
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, stop_event.set)
+        await stop_event.wait()
+
+        # Stops accepting requests, then drains the update queue before the
+        # bot session is closed. Telegram sends new updates to other replicas.
+        logger.info("Stopping the web server and draining queued updates...")
+        await runner.cleanup()
+        await health.stop()
+        await dp.emit_shutdown(bot=bot, dispatcher=dp)
 
     else:
         # --- Polling Mode ---
@@ -9,6 +9,16 @@ class DatabaseConfig:
     """Database connection configuration."""
 
     url: URL
+    # Optional streaming replica for read-only queries
+    replica_url: URL | None = None
+    # Connection pool per engine and process
+    pool_size: int = 5
+    max_overflow: int = 10
+    pool_recycle: int = -1  # seconds, -1 keeps connections indefinitely
+    pool_pre_ping: bool = True
+    statement_timeout: int | None = None  # milliseconds
+    # PgBouncer in transaction mode: no pooling or prepared statement caches
+    pgbouncer: bool = False
 
 
 @dataclass
@@ -28,6 +38,9 @@ class WebhookConfig:
     path: str
     host: str
     port: int
+    # Updates are acknowledged at once and processed by this many workers
+    workers: int = 10
+    max_pending: int = 1000
 
 
 @dataclass
@@ -42,6 +55,43 @@ class RedisConfig:
     middleware_database: int
 
 
+@dataclass
+class RateLimit:
+    """A token bucket: `burst` events at once, refilled at `rate` per second."""
+
+    rate: float
+    burst: int
+
+
+@dataclass
+class ThrottlingConfig:
+    """Per-user rate limits by event type."""
+
+    messages: RateLimit
+    callbacks: RateLimit
+    admin: RateLimit
+
+
+@dataclass
+class SqlReportConfig:
+    """Thresholds for logging the SQL statements of a single update."""
+
+    max_queries: int = 10
+    max_ms: int = 200
+    # An identical statement run this many times hints at an N+1 pattern
+    max_repeats: int = 3
+
+
+@dataclass
+class TracingConfig:
+    """Span recording to a local OTLP/JSON file, disabled without a path."""
+
+    path: str | None = None
+    sample_rate: float = 0.01
+    # Traces slower than this are always kept
+    slow_ms: int = 1000
+
+
 @dataclass
 class Config:
     """Main configuration object."""
@@ -50,6 +100,9 @@ class Config:
     db: DatabaseConfig
     redis: RedisConfig
     webhook: WebhookConfig
+    throttling: ThrottlingConfig
+    sql_report: SqlReportConfig
+    tracing: TracingConfig
 
 
 def load_config(path: str | None = ".env") -> Config:
@@ -65,6 +118,16 @@ def load_config(path: str | None = ".env") -> Config:
     env = Env()
     env.read_env(path)
 
+    db_url = URL.create(
+        drivername="postgresql+asyncpg",
+        host=env("DB_HOST"),
+        port=env.int("DB_PORT"),
+        username=env("DB_USER"),
+        password=env("DB_PASSWORD"),
+        database=env("DATABASE"),
+    )
+    replica_host = env("DB_REPLICA_HOST", None)
+
     return Config(
         bot=TgBot(
             token=env("BOT_TOKEN"),
@@ -72,14 +135,21 @@ def load_config(path: str | None = ".env") -> Config:
             admin_password=env("ADMIN_PASSWORD"),
         ),
         db=DatabaseConfig(
-            url=URL.create(
-                drivername="postgresql+asyncpg",
-                host=env("DB_HOST"),
-                port=env.int("DB_PORT"),
-                username=env("DB_USER"),
-                password=env("DB_PASSWORD"),
-                database=env("DATABASE"),
-            )
+            url=db_url,
+            replica_url=(
+                db_url.set(
+                    host=replica_host,
+                    port=env.int("DB_REPLICA_PORT", db_url.port),
+                )
+                if replica_host
+                else None
+            ),
+            pool_size=env.int("DB_POOL_SIZE", 5),
+            max_overflow=env.int("DB_MAX_OVERFLOW", 10),
+            pool_recycle=env.int("DB_POOL_RECYCLE", -1),
+            pool_pre_ping=env.bool("DB_POOL_PRE_PING", True),
+            statement_timeout=env.int("DB_STATEMENT_TIMEOUT", None),
+            pgbouncer=env.bool("DB_PGBOUNCER", False),
         ),
         redis=RedisConfig(
             host=env("REDIS_HOST"),
@@ -94,5 +164,31 @@ def load_config(path: str | None = ".env") -> Config:
             path=env("WEBHOOK_PATH", "/webhook"),
             host=env("WEB_SERVER_HOST", "0.0.0.0"),
             port=env.int("WEB_SERVER_PORT", 8080),
+            workers=env.int("WEBHOOK_WORKERS", 10),
+            max_pending=env.int("WEBHOOK_MAX_PENDING", 1000),
+        ),
+        throttling=ThrottlingConfig(
+            messages=RateLimit(
+                rate=env.float("THROTTLE_MESSAGE_RATE", 0.5),
+                burst=env.int("THROTTLE_MESSAGE_BURST", 3),
+            ),
+            callbacks=RateLimit(
+                rate=env.float("THROTTLE_CALLBACK_RATE", 2.0),
+                burst=env.int("THROTTLE_CALLBACK_BURST", 6),
+            ),
+            admin=RateLimit(
+                rate=env.float("THROTTLE_ADMIN_RATE", 5.0),
+                burst=env.int("THROTTLE_ADMIN_BURST", 20),
+            ),
+        ),
+        sql_report=SqlReportConfig(
+            max_queries=env.int("SQL_REPORT_QUERIES", 10),
+            max_ms=env.int("SQL_REPORT_MS", 200),
+            max_repeats=env.int("SQL_REPORT_REPEATS", 3),
+        ),
+        tracing=TracingConfig(
+            path=env("TRACE_FILE", None),
+            sample_rate=env.float("TRACE_SAMPLE_RATE", 0.01),
+            slow_ms=env.int("TRACE_SLOW_MS", 1000),
         ),
     )
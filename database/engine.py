@@ -0,0 +1,68 @@
+import uuid
+
+from loguru import logger
+from sqlalchemy.engine.url import URL
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from config_data.config import DatabaseConfig
+
+
+def _prepared_statement_name() -> str:
+    # asyncpg numbers statements per connection, which collides behind PgBouncer
+    return f"__asyncpg_{uuid.uuid4()}__"
+
+
+def create_engine(db_config: DatabaseConfig, url: URL | None = None) -> AsyncEngine:
+    """
+    Creates an engine with the pool and driver settings from the config.
+
+    Args:
+        db_config: The database configuration.
+        url: The URL to connect to, the primary by default.
+
+    Returns:
+        An AsyncEngine.
+    """
+    connect_args = {}
+    engine_args = {}
+
+    if db_config.pgbouncer:
+        # PgBouncer owns pooling. Prepared statements do not survive a server
+        # connection switch in transaction mode, so every cache is disabled.
+        engine_args["poolclass"] = NullPool
+        connect_args.update(
+            statement_cache_size=0,
+            prepared_statement_cache_size=0,
+            prepared_statement_name_func=_prepared_statement_name,
+        )
+        if db_config.statement_timeout:
+            # Startup parameters are rejected by PgBouncer, so time out client-side
+            connect_args["command_timeout"] = db_config.statement_timeout / 1000
+    else:
+        engine_args.update(
+            pool_size=db_config.pool_size,
+            max_overflow=db_config.max_overflow,
+            pool_recycle=db_config.pool_recycle,
+            pool_pre_ping=db_config.pool_pre_ping,
+        )
+        if db_config.statement_timeout:
+            connect_args["server_settings"] = {
+                "statement_timeout": str(db_config.statement_timeout)
+            }
+
+    return create_async_engine(
+        url=url or db_config.url, echo=False, connect_args=connect_args, **engine_args
+    )
+
+
+def create_engines(db_config: DatabaseConfig) -> tuple[AsyncEngine, AsyncEngine | None]:
+    """Creates the primary engine and, if configured, the read replica engine."""
+    engine = create_engine(db_config)
+    replica_engine = None
+    if db_config.replica_url:
+        replica_engine = create_engine(db_config, db_config.replica_url)
+    mode = "PgBouncer mode" if db_config.pgbouncer else f"pool of {db_config.pool_size}"
+    replica = ", with a read replica" if replica_engine else ""
+    logger.info(f"Database engines created ({mode}{replica}).")
+    return engine, replica_engine
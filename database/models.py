@@ -11,6 +11,7 @@ from sqlalchemy import (
     Identity,
     Index,
     Integer,
+    SmallInteger,
     String,
     Time,
     UniqueConstraint,
@@ -101,6 +102,9 @@ class Booking(Base):
     )
     booking_datetime = Column(AwareDateTime, nullable=False)
     window_number = Column(Integer, nullable=False)
+    # Local (Moscow) date and 5-minute slot of booking_datetime for per-day lookups
+    booking_date = Column(Date, nullable=False)
+    slot_index = Column(SmallInteger, nullable=False)  # Minutes since midnight / 5
 
     user = relationship("User", back_populates="booking")
 
@@ -108,6 +112,7 @@ class Booking(Base):
         UniqueConstraint(
             "booking_datetime", "window_number", name="uq_booking_time_window"
         ),
+        Index("ix_booking_date_window", "booking_date", "window_number"),
     )
 
     def __repr__(self) -> str:
@@ -0,0 +1,78 @@
+from sqlalchemy import text
+from sqlalchemy.exc import ProgrammingError
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+# Bump whenever the models, BOOKINGS_UPGRADE or the initial data change:
+# replicas only create, upgrade and seed tables when the stored version is
+# older than this one.
+SCHEMA_VERSION = 1
+# Key of the Postgres advisory lock held while the schema is bootstrapped
+BOOTSTRAP_LOCK_ID = 0x44415342  # "DASB"
+
+CREATE_VERSION_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_version (
+    id SMALLINT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    version INTEGER NOT NULL
+)
+"""
+SELECT_VERSION = "SELECT version FROM schema_version WHERE id = 1"
+UPSERT_VERSION = """
+INSERT INTO schema_version (id, version) VALUES (1, :version)
+ON CONFLICT (id) DO UPDATE SET version = EXCLUDED.version
+"""
+
+# `create_all` only creates missing tables, so columns added to existing
+# tables are upgraded here. Every statement is idempotent.
+BOOKINGS_UPGRADE = [
+    "ALTER TABLE bookings ADD COLUMN IF NOT EXISTS booking_date DATE",
+    "ALTER TABLE bookings ADD COLUMN IF NOT EXISTS slot_index SMALLINT",
+    """
+    UPDATE bookings
+    SET booking_date = (booking_datetime AT TIME ZONE 'Europe/Moscow')::date,
+        slot_index = (
+            EXTRACT(HOUR FROM booking_datetime AT TIME ZONE 'Europe/Moscow') * 60
+            + EXTRACT(MINUTE FROM booking_datetime AT TIME ZONE 'Europe/Moscow')
+        )::int / 5
+    WHERE booking_date IS NULL OR slot_index IS NULL
+    """,
+    "ALTER TABLE bookings ALTER COLUMN booking_date SET NOT NULL",
+    "ALTER TABLE bookings ALTER COLUMN slot_index SET NOT NULL",
+    """
+    CREATE INDEX IF NOT EXISTS ix_booking_date_window
+    ON bookings (booking_date, window_number)
+    """,
+]
+
+
+async def upgrade_schema(conn: AsyncConnection) -> None:
+    """Brings tables created by older versions up to the current models."""
+    for statement in BOOKINGS_UPGRADE:
+        await conn.execute(text(statement))
+
+
+async def read_schema_version(conn: AsyncConnection) -> int:
+    """
+    Returns the version the database was bootstrapped with, or 0 for a new
+    database. Takes a single query, which fails the current transaction if
+    the marker table is missing.
+    """
+    try:
+        return await conn.scalar(text(SELECT_VERSION)) or 0
+    except ProgrammingError:
+        return 0
+
+
+async def lock_schema(conn: AsyncConnection) -> int:
+    """
+    Waits for the bootstrap lock, held until the transaction ends, and
+    returns the stored version as of then.
+    """
+    await conn.execute(
+        text("SELECT pg_advisory_xact_lock(:key)"), {"key": BOOTSTRAP_LOCK_ID}
+    )
+    await conn.execute(text(CREATE_VERSION_TABLE))
+    return await read_schema_version(conn)
+
+
+async def write_schema_version(conn: AsyncConnection, version: int) -> None:
+    await conn.execute(text(UPSERT_VERSION), {"version": version})
@@ -0,0 +1,85 @@
+from sqlalchemy import Engine, Select, event
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+from sqlalchemy.orm import ORMExecuteState, Session, SessionTransaction
+
+# Session.info keys
+HAS_WRITES = "has_writes"  # The current transaction has written
+WROTE = "wrote"  # The session has written at some point
+USE_PRIMARY = "use_primary"  # Route every further statement to the primary
+REPLICA_BIND = "replica_bind"
+
+
+@event.listens_for(Session, "after_flush")
+def _mark_flush_writes(session: Session, flush_context) -> None:
+    session.info[HAS_WRITES] = session.info[WROTE] = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _mark_statement_writes(orm_execute_state: ORMExecuteState) -> None:
+    if not orm_execute_state.is_select:
+        info = orm_execute_state.session.info
+        info[HAS_WRITES] = info[WROTE] = True
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _clear_writes(session: Session, transaction: SessionTransaction) -> None:
+    if transaction.parent is None:
+        session.info.pop(HAS_WRITES, None)
+
+
+class RoutingSession(Session):
+    """
+    Sends plain SELECTs to the read replica and everything else to the primary.
+
+    Once a session has written, all its later reads go to the primary too, so
+    an update reads its own writes. Statements that must see the latest data
+    can opt out of the replica with `.execution_options(use_primary=True)`.
+    """
+
+    def get_bind(self, mapper=None, *, clause=None, **kw):
+        replica: Engine | None = self.info.get(REPLICA_BIND)
+        if (
+            replica is not None
+            and not self._flushing
+            and not self.info.get(USE_PRIMARY)
+            and not self.info.get(WROTE)
+            and isinstance(clause, Select)
+            and clause._for_update_arg is None
+            and not clause.get_execution_options().get(USE_PRIMARY)
+        ):
+            return replica
+        return super().get_bind(mapper, clause=clause, **kw)
+
+
+def create_session_maker(
+    engine: AsyncEngine, replica_engine: AsyncEngine | None = None
+) -> async_sessionmaker[AsyncSession]:
+    """Creates the session factory, routing reads to the replica if one is given."""
+    if replica_engine is None:
+        return async_sessionmaker(engine, expire_on_commit=False)
+    return async_sessionmaker(
+        engine,
+        expire_on_commit=False,
+        sync_session_class=RoutingSession,
+        info={REPLICA_BIND: replica_engine.sync_engine},
+    )
+
+
+def pin_to_primary(session: AsyncSession) -> None:
+    """Routes all further statements of a session to the primary."""
+    session.info[USE_PRIMARY] = True
+
+
+async def release_read_only_connection(session: AsyncSession) -> None:
+    """
+    Ends the session's transaction if it has only read so far, returning its
+    connections to the pool. Loaded objects stay usable, since sessions are
+    created with expire_on_commit=False.
+    """
+    if (
+        session.in_transaction()
+        and not session.in_nested_transaction()
+        and not session.info.get(HAS_WRITES)
+        and not (session.new or session.dirty or session.deleted)
+    ):
+        await session.commit()
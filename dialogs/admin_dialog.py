@@ -1,4 +1,5 @@
 import datetime
+import hashlib
 import os
 import re
 
@@ -24,7 +25,8 @@ from magic_filter import F
 from sqlalchemy import distinct, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from database.models import LastDay, ScheduleException, TimetableSlot
+from database.models import LastDay, ScheduleException
+from database.session import pin_to_primary
 from dialogs.schedule_dialog import BoundedCalendar
 from lexicon import LocalizedTextFormat, lexicon
 from services.admin_actions import (
@@ -35,6 +37,10 @@ from services.admin_actions import (
     get_statistics,
     update_schedule_exception,
 )
+from services.availability_cache import AvailabilityCache
+from services.idempotency import idempotent
+from services.invalidation import invalidation_bus
+from services.reference_data import REFERENCE_DATA_TOPIC, reference_data
 from services.report_service import generate_excel_report
 
 
@@ -83,12 +89,8 @@ async def get_last_day_data(dialog_manager: DialogManager, **kwargs) -> dict:
     """Gets the current last day for display."""
     session: AsyncSession = dialog_manager.middleware_data["session"]
     lang = dialog_manager.middleware_data.get("lang")
-    last_day_record = await session.get(LastDay, 1)
-    date_str = (
-        last_day_record.last_date.strftime("%d.%m.%Y")
-        if last_day_record
-        else lexicon(lang, "not_set")
-    )
+    last_day = (await reference_data.get(session)).last_day
+    date_str = last_day.strftime("%d.%m.%Y") if last_day else lexicon(lang, "not_set")
     return {"date_str": date_str}
 
 
@@ -98,19 +100,13 @@ async def get_default_slots_data(dialog_manager: DialogManager, **kwargs) -> dic
     for later lookup in handlers.
     """
     session: AsyncSession = dialog_manager.middleware_data["session"]
-    stmt = (
-        select(TimetableSlot.start_time, TimetableSlot.end_time)
-        .distinct()
-        .order_by(TimetableSlot.start_time)
-    )
-    result = await session.execute(stmt)
-    slots = result.all()
+    slots = (await reference_data.get(session)).distinct_times()
     formatted_slots = [
         (
-            f"{s.start_time.strftime('%H:%M')} - {s.end_time.strftime('%H:%M')}",
-            f"{s.start_time.isoformat()}",
+            f"{start_time.strftime('%H:%M')} - {end_time.strftime('%H:%M')}",
+            f"{start_time.isoformat()}",
         )
-        for s in slots
+        for start_time, end_time in slots
     ]
     # Cache the data for the handler to use
     dialog_manager.dialog_data["_slots_cache"] = formatted_slots
@@ -190,6 +186,8 @@ async def get_selected_exception_details_data(
         return await get_add_confirmation_data(dialog_manager, **kwargs)
 
     session: AsyncSession = dialog_manager.middleware_data["session"]
+    # The edit wizard writes these fields back, so read them from the primary
+    pin_to_primary(session)
     exc = await session.get(ScheduleException, exc_id)
     if not exc:
         return {}
@@ -348,8 +346,13 @@ async def on_date_selected(
 ):
     """Handles selection of a new last booking date."""
     session: AsyncSession = dialog_manager.middleware_data["session"]
+    cache: AvailabilityCache | None = dialog_manager.middleware_data.get(
+        "availability_cache"
+    )
     lang = dialog_manager.middleware_data.get("lang")
 
+    # A lagging replica would miss the row and make us insert it again
+    pin_to_primary(session)
     last_day_record = await session.get(LastDay, 1)
     if not last_day_record:
         last_day_record = LastDay(id=1, last_date=date)
@@ -358,6 +361,9 @@ async def on_date_selected(
         last_day_record.last_date = date
 
     await session.commit()
+    await invalidation_bus.publish(REFERENCE_DATA_TOPIC)
+    if cache:
+        await cache.invalidate_all()
     logger.info(f"Admin {callback.from_user.id} set last day to {date.isoformat()}")
     await callback.answer(
         lexicon(lang, "last_day_set_success", date=date.strftime("%d.%m.%Y"))
@@ -373,9 +379,16 @@ async def on_broadcast_text_input(
     await dialog_manager.switch_to(AdminSG.broadcast_confirm)
 
 
+def _broadcast_payload(dialog_manager: DialogManager) -> str:
+    text = dialog_manager.dialog_data.get("broadcast_text") or ""
+    return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+
+# Claimed for as long as a broadcast to every user may take
+@idempotent(payload=_broadcast_payload, ttl=3600)
 async def on_broadcast_confirm(
     callback: CallbackQuery, button: Button, dialog_manager: DialogManager
-):
+) -> str | None:
     """Confirms and sends the broadcast message."""
     lang = dialog_manager.middleware_data.get("lang")
     if button.widget_id == "confirm_broadcast":
@@ -395,6 +408,7 @@ async def on_broadcast_confirm(
             )
         )
         await dialog_manager.done()
+        return lexicon(lang, "repeat_broadcast_done")
     else:
         await dialog_manager.switch_to(AdminSG.main_menu)
 
@@ -413,6 +427,7 @@ async def on_non_working_date_selected(
         session=session,
         date=date,
         description=f"Non-working day added by admin {callback.from_user.id}",
+        cache=dialog_manager.middleware_data.get("availability_cache"),
     )
     logger.info(f"Admin {callback.from_user.id} marked {date} as non-working.")
     await callback.answer(
@@ -578,11 +593,16 @@ async def on_confirm_exception_action(
     callback: CallbackQuery, button: Button, dialog_manager: DialogManager
 ):
     session: AsyncSession = dialog_manager.middleware_data["session"]
+    cache: AvailabilityCache | None = dialog_manager.middleware_data.get(
+        "availability_cache"
+    )
     lang = dialog_manager.middleware_data.get("lang")
     editing_id = dialog_manager.dialog_data.pop("editing_exception_id", None)
 
     if editing_id:
-        await update_schedule_exception(session, editing_id, dialog_manager.dialog_data)
+        await update_schedule_exception(
+            session, editing_id, dialog_manager.dialog_data, cache
+        )
         logger.info(
             f"Admin {callback.from_user.id} updated schedule exception ID {editing_id}"
         )
@@ -590,7 +610,7 @@ async def on_confirm_exception_action(
             lexicon(lang, "admin_exception_updated_success"), show_alert=True
         )
     else:
-        await create_schedule_exception(session, dialog_manager.dialog_data)
+        await create_schedule_exception(session, dialog_manager.dialog_data, cache)
         logger.info(
             f"Admin {callback.from_user.id} created a new schedule exception: {dialog_manager.dialog_data.get('description')}"
         )
@@ -628,8 +648,11 @@ async def on_confirm_exception_delete(
     """Deletes the exception from the database."""
     session: AsyncSession = dialog_manager.middleware_data["session"]
     lang = dialog_manager.middleware_data.get("lang")
+    cache: AvailabilityCache | None = dialog_manager.middleware_data.get(
+        "availability_cache"
+    )
     exc_id = dialog_manager.dialog_data["selected_exception_id"]
-    await delete_schedule_exception(session, exc_id)
+    await delete_schedule_exception(session, exc_id, cache)
     logger.info(f"Admin {callback.from_user.id} deleted schedule exception ID {exc_id}")
     await callback.answer(
         lexicon(lang, "admin_exception_deleted_success"), show_alert=True
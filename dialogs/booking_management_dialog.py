@@ -10,10 +10,13 @@ from loguru import logger
 from magic_filter import F
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from database.models import User
 from dialogs.schedule_dialog import ScheduleSG
 from lexicon import LocalizedTextFormat, lexicon
-from services.schedule_service import cancel_booking, get_user_booking
+from services.availability_cache import AvailabilityCache
+from services.idempotency import idempotent
+from services.schedule_service import cancel_booking
+from services.tracing import traced
+from services.user_profiles import UserProfile, UserProfileCache
 
 
 class BookingManagementSG(StatesGroup):
@@ -24,22 +27,20 @@ class BookingManagementSG(StatesGroup):
 
 
 # --- Getters ---
+@traced()
 async def get_booking_data(dialog_manager: DialogManager, **kwargs):
     """
     Prepares data for the booking view window.
     Also determines if cancellation/rescheduling is allowed.
     """
-    session: AsyncSession = dialog_manager.middleware_data["session"]
-    user: User = dialog_manager.middleware_data["user"]
+    user: UserProfile | None = dialog_manager.middleware_data.get("user")
     lang: str = dialog_manager.middleware_data.get("lang")
     moscow_tz = ZoneInfo("Europe/Moscow")
 
-    booking = await get_user_booking(session, user)
-    if not booking:
+    if user is None or not user.booking_datetime:
         return {"has_booking": False}
 
-    # The datetime from DB is now automatically in Moscow time thanks to AwareDateTime type
-    dt_moscow = booking.booking_datetime
+    dt_moscow = user.booking_datetime.astimezone(moscow_tz)
     now_moscow = datetime.datetime.now(moscow_tz)
 
     time_diff = dt_moscow - now_moscow
@@ -53,26 +54,37 @@ async def get_booking_data(dialog_manager: DialogManager, **kwargs):
         "date": dt_moscow.strftime("%d.%m.%Y"),
         "time": dt_moscow.strftime("%H:%M"),
         "weekday": lexicon(lang, f"weekday_{dt_moscow.weekday()}"),
-        "window": booking.window_number,
+        "window": user.booking_window,
         "can_modify": can_modify,
     }
 
 
 # --- Handlers ---
+@idempotent()
 async def on_cancel_booking(
     callback: CallbackQuery, button: Button, dialog_manager: DialogManager
-):
+) -> str:
     """Handles the final confirmation of booking cancellation."""
     session: AsyncSession = dialog_manager.middleware_data["session"]
-    user: User = dialog_manager.middleware_data["user"]
+    user: UserProfile | None = dialog_manager.middleware_data.get("user")
     lang: str = dialog_manager.middleware_data.get("lang")
+    cache: AvailabilityCache | None = dialog_manager.middleware_data.get(
+        "availability_cache"
+    )
+    profiles: UserProfileCache | None = dialog_manager.middleware_data.get(
+        "user_profiles"
+    )
 
-    was_cancelled, reason = await cancel_booking(session, user)
+    if user is None:
+        await callback.answer(lexicon(lang, "not_registered"), show_alert=True)
+        return lexicon(lang, "not_registered")
+    was_cancelled, reason = await cancel_booking(session, user, cache, profiles)
 
     if was_cancelled:
         logger.info(f"User {user.telegram_id} cancelled their booking via dialog.")
         await callback.message.answer(lexicon(lang, "cancel_successful"))
         await dialog_manager.done()
+        return lexicon(lang, "repeat_cancel_done")
     else:
         logger.warning(
             f"User {user.telegram_id} failed to cancel booking. Reason: {reason}"
@@ -80,6 +92,7 @@ async def on_cancel_booking(
         await callback.answer(lexicon(lang, "cancel_failed_too_late"), show_alert=True)
         # Close the confirmation window and return to the main view
         await dialog_manager.switch_to(BookingManagementSG.view_booking)
+        return lexicon(lang, "cancel_failed_too_late")
 
 
 async def on_reschedule(
@@ -5,11 +5,13 @@ from aiogram_dialog.widgets.input import TextInput
 from aiogram_dialog.widgets.kbd import Back, Button, Group, Select
 from aiogram_dialog.widgets.text import Format
 from loguru import logger
-from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from database.models import Faculty, User
+from database.models import User
 from lexicon import LocalizedTextFormat, lexicon
+from services.reference_data import reference_data
+from services.tracing import traced
+from services.user_profiles import UserProfile, UserProfileCache
 
 from .schedule_dialog import ScheduleSG
 
@@ -25,17 +27,18 @@ class RegistrationSG(StatesGroup):
 
 
 # --- Getters ---
+@traced()
 async def get_faculties_data(
     dialog_manager: DialogManager, **kwargs
 ) -> dict[str, list]:
-    """Retrieves a list of faculties from the database."""
+    """Retrieves the list of faculties from the reference data cache."""
     session: AsyncSession = dialog_manager.middleware_data["session"]
-    result = await session.scalars(select(Faculty).order_by(Faculty.name))
-    faculties = result.all()
+    faculties = (await reference_data.get(session)).faculties
     # Format for the Select widget: list of tuples (display_text, id)
     return {"faculties": [(f.name, f.faculty_id) for f in faculties]}
 
 
+@traced()
 async def get_year_data(dialog_manager: DialogManager, **kwargs) -> dict[str, list]:
     """Generates a list of years based on the selected degree."""
     lang = dialog_manager.middleware_data.get("lang")
@@ -52,13 +55,14 @@ async def get_year_data(dialog_manager: DialogManager, **kwargs) -> dict[str, li
     }
 
 
+@traced()
 async def get_confirmation_data(dialog_manager: DialogManager, **kwargs) -> dict:
     """Prepares data for the confirmation window."""
     session: AsyncSession = dialog_manager.middleware_data["session"]
     lang = dialog_manager.middleware_data.get("lang")
     faculty_id = dialog_manager.dialog_data.get("faculty_id")
 
-    faculty = await session.get(Faculty, faculty_id)
+    faculty = (await reference_data.get(session)).faculty(faculty_id)
 
     data = {
         "last_name": dialog_manager.dialog_data.get("last_name"),
@@ -139,6 +143,24 @@ async def on_confirm(
     await session.commit()
     logger.info(f"New user registered: {new_user}")
 
+    faculty = (await reference_data.get(session)).faculty(new_user.faculty_id)
+    profile = UserProfile(
+        user_id=new_user.user_id,
+        telegram_id=new_user.telegram_id,
+        lang=new_user.lang,
+        window=faculty.window_number if faculty else None,
+        year=new_user.year,
+        is_admin=False,
+        is_signed_up=False,
+    )
+    profiles: UserProfileCache | None = dialog_manager.middleware_data.get(
+        "user_profiles"
+    )
+    if profiles:
+        await profiles.store(profile)
+    # The scheduling dialog started below renders within this same update
+    dialog_manager.middleware_data["user"] = profile
+
     await callback.message.edit_text(lexicon(lang, "registration_successful"))
     # Seamlessly start the scheduling dialog for the new user
     await dialog_manager.start(ScheduleSG.date_select, mode=StartMode.RESET_STACK)
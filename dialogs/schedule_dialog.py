@@ -1,22 +1,36 @@
-import dataclasses
 import datetime
-from typing import Dict, List
+from typing import Dict
 
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.types import CallbackQuery, InlineKeyboardButton
+from aiogram.types import CallbackQuery
 from aiogram_dialog import Dialog, DialogManager, Window
 from aiogram_dialog.widgets.kbd import Button, Calendar, Group, Select, SwitchTo
-from aiogram_dialog.widgets.kbd.calendar_kbd import CalendarConfig
-from aiogram_dialog.widgets.text import Const, Format
+from aiogram_dialog.widgets.kbd.calendar_kbd import (
+    CalendarDaysView,
+    CalendarScope,
+    CalendarScopeView,
+    CalendarUserConfig,
+)
+from aiogram_dialog.widgets.text import Const, Format, Text
 from aiogram.types import FSInputFile
 from aiogram.exceptions import TelegramBadRequest
 from loguru import logger
 from magic_filter import F
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from database.models import LastDay, User
 from lexicon import LocalizedTextFormat, lexicon
-from services.schedule_service import create_booking, get_available_slots
+from services.availability_cache import AvailabilityCache
+from services.idempotency import idempotent
+from services.reference_data import reference_data
+from services.schedule_service import (
+    create_booking,
+    get_available_slots,
+    get_days_availability,
+    slot_position,
+)
+from services.slot_holds import SlotHolds
+from services.tracing import traced
+from services.user_profiles import UserProfile, UserProfileCache
 
 
 class ScheduleSG(StatesGroup):
@@ -27,55 +41,95 @@ class ScheduleSG(StatesGroup):
     confirm = State()
 
 
+class AvailabilityDateText(Text):
+    """Renders a calendar day, crossing it out if it has no free slots."""
+
+    def __init__(self, template: str):
+        super().__init__()
+        self.template = template
+
+    async def _render_text(self, data: Dict, manager: DialogManager) -> str:
+        day: datetime.date = data["date"]
+        if data["data"].get("day_availability", {}).get(day) == 0:
+            return "✖"
+        return self.template.format(date=day)
+
+
 class BoundedCalendar(Calendar):
-    """A calendar widget with dynamically set min/max dates from getter data."""
+    """
+    A calendar widget with dynamically set min/max dates from getter data.
+    Days with zero free slots in the `day_availability` getter key are crossed out.
+    """
 
-    async def _render_kbd(
+    async def _get_user_config(
         self, data: Dict, manager: DialogManager
-    ) -> List[List[InlineKeyboardButton]]:
-        min_date = data.get("min_date")
-        max_date = data.get("max_date")
-
-        # Create a new config for this render pass, inheriting from the original
-        render_config = dataclasses.replace(
-            self._config, min_date=min_date, max_date=max_date
+    ) -> CalendarUserConfig:
+        return CalendarUserConfig(
+            min_date=data.get("min_date"), max_date=data.get("max_date")
         )
 
-        # Temporarily swap config for the render call
-        original_config = self._config
-        self._config = render_config
-        kbd = await super()._render_kbd(data, manager)
-        self._config = original_config  # Restore it to prevent side-effects
-        return kbd
+    def _init_views(self) -> Dict[CalendarScope, CalendarScopeView]:
+        views = super()._init_views()
+        views[CalendarScope.DAYS] = CalendarDaysView(
+            self._item_callback_data,
+            date_text=AvailabilityDateText("{date:%d}"),
+            today_text=AvailabilityDateText("[ {date:%d} ]"),
+        )
+        return views
 
 
 # --- Getters ---
+@traced()
 async def get_dates_data(dialog_manager: DialogManager, **kwargs) -> dict:
-    """Prepares data for the date selection window."""
+    """
+    Prepares data for the date selection window, including free slot counts
+    for the visible month so that full days can be crossed out.
+    """
     session: AsyncSession = dialog_manager.middleware_data["session"]
-    last_day_record = await session.get(LastDay, 1)
+    user: UserProfile | None = dialog_manager.middleware_data.get("user")
+    ref = await reference_data.get(session)
 
     min_date = datetime.date.today()
     # If last_day is not set in DB, prevent booking by setting max_date to yesterday
-    max_date = (
-        last_day_record.last_date
-        if last_day_record
-        else min_date - datetime.timedelta(days=1)
+    max_date = ref.last_day or min_date - datetime.timedelta(days=1)
+
+    offset = dialog_manager.find("calendar").get_offset() or min_date
+    month_start = offset.replace(day=1)
+    month_end = (month_start + datetime.timedelta(days=31)).replace(
+        day=1
+    ) - datetime.timedelta(days=1)
+    day_availability = await get_days_availability(
+        session, user, max(month_start, min_date), min(month_end, max_date)
     )
+    # Cache full days for the click handler, so it can reject them without queries
+    dialog_manager.dialog_data["full_days"] = [
+        day.isoformat()
+        for day, free_slots in day_availability.items()
+        if not free_slots
+    ]
 
-    return {"min_date": min_date, "max_date": max_date}
+    return {
+        "min_date": min_date,
+        "max_date": max_date,
+        "day_availability": day_availability,
+    }
 
 
+@traced()
 async def get_times_data(dialog_manager: DialogManager, **kwargs) -> dict:
     """Prepares data for the time selection window."""
     session: AsyncSession = dialog_manager.middleware_data["session"]
-    user: User = dialog_manager.middleware_data["user"]
+    user: UserProfile | None = dialog_manager.middleware_data.get("user")
+    cache: AvailabilityCache | None = dialog_manager.middleware_data.get(
+        "availability_cache"
+    )
+    holds: SlotHolds | None = dialog_manager.middleware_data.get("slot_holds")
     selected_date_iso = dialog_manager.dialog_data.get("selected_date")
     if not selected_date_iso:
         return {"slots": [], "has_slots": False}
 
     selected_date = datetime.date.fromisoformat(selected_date_iso)
-    slots = await get_available_slots(session, user, selected_date)
+    slots = await get_available_slots(session, user, selected_date, cache, holds)
 
     return {
         "selected_date_str": selected_date.strftime("%d.%m.%Y"),
@@ -84,6 +138,7 @@ async def get_times_data(dialog_manager: DialogManager, **kwargs) -> dict:
     }
 
 
+@traced()
 async def get_confirmation_data(dialog_manager: DialogManager, **kwargs) -> dict:
     """Prepares data for the confirmation window."""
     lang = dialog_manager.middleware_data.get("lang")
@@ -108,12 +163,8 @@ async def on_date_selected(
     lang = dialog_manager.middleware_data.get("lang")
 
     # --- Backend Validation ---
-    last_day_record = await session.get(LastDay, 1)
-    max_date = (
-        last_day_record.last_date
-        if last_day_record
-        else datetime.date.today() - datetime.timedelta(days=1)
-    )
+    ref = await reference_data.get(session)
+    max_date = ref.last_day or datetime.date.today() - datetime.timedelta(days=1)
 
     if selected_date > max_date:
         await callback.answer(
@@ -121,31 +172,85 @@ async def on_date_selected(
             show_alert=True,
         )
         return
+    if selected_date.isoformat() in dialog_manager.dialog_data.get("full_days", []):
+        await callback.answer(lexicon(lang, "no_slots_available"), show_alert=True)
+        return
     # --- End Validation ---
 
     dialog_manager.dialog_data["selected_date"] = selected_date.isoformat()
     await dialog_manager.switch_to(ScheduleSG.time_select)
 
 
+async def _release_hold(dialog_manager: DialogManager) -> None:
+    """Releases the user's hold on the selected slot, if there is one."""
+    holds: SlotHolds | None = dialog_manager.middleware_data.get("slot_holds")
+    dt_iso = dialog_manager.dialog_data.get("selected_datetime")
+    user: UserProfile | None = dialog_manager.middleware_data.get("user")
+    if not holds or not dt_iso or user is None:
+        return
+    slot_date, slot_index = slot_position(datetime.datetime.fromisoformat(dt_iso))
+    await holds.release(slot_date, user.window, slot_index, user.user_id)
+
+
 async def on_time_selected(
     callback: CallbackQuery, widget: Select, dialog_manager: DialogManager, item_id: str
 ):
-    """Handles time slot selection."""
+    """
+    Handles time slot selection.
+    The slot is held while the user is on the confirmation screen.
+    """
+    holds: SlotHolds | None = dialog_manager.middleware_data.get("slot_holds")
+    user: UserProfile | None = dialog_manager.middleware_data.get("user")
+    lang = dialog_manager.middleware_data.get("lang")
+    if user is None:
+        await callback.answer(lexicon(lang, "not_registered"), show_alert=True)
+        return
+    if holds:
+        slot_date, slot_index = slot_position(datetime.datetime.fromisoformat(item_id))
+        if not await holds.acquire(
+            slot_date, user.window, slot_index, user.user_id
+        ):
+            await callback.answer(
+                lexicon(lang, "booking_failed_too_late"), show_alert=True
+            )
+            return
+
     dialog_manager.dialog_data["selected_datetime"] = item_id
     await dialog_manager.switch_to(ScheduleSG.confirm)
 
 
-async def on_booking_confirm(
+async def on_confirm_back(
     callback: CallbackQuery, button: Button, dialog_manager: DialogManager
 ):
+    """Releases the held slot when the user goes back to time selection."""
+    await _release_hold(dialog_manager)
+
+
+@idempotent(payload=lambda manager: manager.dialog_data.get("selected_datetime", ""))
+async def on_booking_confirm(
+    callback: CallbackQuery, button: Button, dialog_manager: DialogManager
+) -> str:
     """Handles the final booking confirmation."""
     session: AsyncSession = dialog_manager.middleware_data["session"]
-    user: User = dialog_manager.middleware_data["user"]
+    user: UserProfile | None = dialog_manager.middleware_data.get("user")
+    cache: AvailabilityCache | None = dialog_manager.middleware_data.get(
+        "availability_cache"
+    )
+    profiles: UserProfileCache | None = dialog_manager.middleware_data.get(
+        "user_profiles"
+    )
     lang = dialog_manager.middleware_data.get("lang")
+    if user is None:
+        await callback.answer(lexicon(lang, "not_registered"), show_alert=True)
+        return lexicon(lang, "not_registered")
     dt_iso = dialog_manager.dialog_data.get("selected_datetime")
     booking_dt = datetime.datetime.fromisoformat(dt_iso)
 
-    booking, error, is_reschedule = await create_booking(session, user, booking_dt)
+    booking, error, is_reschedule = await create_booking(
+        session, user, booking_dt, cache, profiles
+    )
+    # The hold has done its job whether the booking was created or not
+    await _release_hold(dialog_manager)
 
     if booking:
         # First, delete the message with the "Confirm" button
@@ -189,6 +294,7 @@ async def on_booking_confirm(
         await callback.message.answer(text=caption_text)
 
         await dialog_manager.done()
+        return lexicon(lang, "repeat_booking_done")
     else:
         logger.warning(
             f"Booking failed for user {user.telegram_id} for slot {booking_dt}. Reason: {error}"
@@ -196,6 +302,7 @@ async def on_booking_confirm(
         await callback.answer(lexicon(lang, f"booking_failed_{error}"), show_alert=True)
         # Go back to time selection, as the slots might have changed
         await dialog_manager.switch_to(ScheduleSG.time_select)
+        return lexicon(lang, f"booking_failed_{error}")
 
 
 # --- Dialog Windows ---
@@ -240,6 +347,7 @@ schedule_dialog = Dialog(
                 LocalizedTextFormat("back_button"),
                 id="back_to_time",
                 state=ScheduleSG.time_select,
+                on_click=on_confirm_back,
             ),
             width=2,
         ),
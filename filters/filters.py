@@ -1,30 +1,22 @@
 from aiogram.filters import BaseFilter
 from aiogram.types import CallbackQuery, Message
-from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncSession
 
-from database.models import User
+from services.user_profiles import UserProfile
 
 
 class IsRegistered(BaseFilter):
-    """Checks if the user is registered in the database."""
+    """Checks if the user is registered, using the profile resolved for the update."""
 
     async def __call__(
-        self, event: Message | CallbackQuery, session: AsyncSession
+        self, event: Message | CallbackQuery, user: UserProfile | None = None
     ) -> bool:
-        user = await session.scalar(
-            select(User).where(User.telegram_id == event.from_user.id)
-        )
-        return bool(user)
+        return user is not None
 
 
 class IsAdmin(BaseFilter):
     """Checks if the user is an administrator."""
 
     async def __call__(
-        self, event: Message | CallbackQuery, session: AsyncSession
+        self, event: Message | CallbackQuery, user: UserProfile | None = None
     ) -> bool:
-        user = await session.scalar(
-            select(User).where(User.telegram_id == event.from_user.id)
-        )
         return bool(user and user.is_admin)
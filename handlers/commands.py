@@ -1,3 +1,4 @@
+import dataclasses
 import datetime
 
 from aiogram import F, Router
@@ -5,6 +6,7 @@ from aiogram.filters import Command, CommandStart
 from aiogram.types import Message
 from aiogram_dialog import DialogManager, StartMode
 from loguru import logger
+from sqlalchemy import update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from config_data import config
@@ -15,7 +17,7 @@ from dialogs.registration_dialog import RegistrationSG
 from dialogs.schedule_dialog import ScheduleSG
 from filters.filters import IsAdmin, IsRegistered
 from lexicon import lexicon
-from services.schedule_service import get_user_booking
+from services.user_profiles import UserProfile, UserProfileCache
 
 commands_router = Router(name="commands-router")
 
@@ -30,11 +32,7 @@ async def start_new_user(message: Message, dialog_manager: DialogManager, lang:
 
 @commands_router.message(CommandStart(), IsRegistered())
 async def start_registered_user(
-    message: Message,
-    dialog_manager: DialogManager,
-    session: AsyncSession,
-    user: User,
-    lang: str,
+    message: Message, dialog_manager: DialogManager, user: UserProfile, lang: str
 ):
     """
     Handles the /start command for registered users.
@@ -42,9 +40,7 @@ async def start_registered_user(
     """
     logger.info(f"Registered user {user.telegram_id} used /start.")
 
-    booking = await get_user_booking(session, user)
-
-    if booking:
+    if user.booking_datetime:
         await dialog_manager.start(
             BookingManagementSG.view_booking, mode=StartMode.RESET_STACK
         )
@@ -61,7 +57,11 @@ async def process_help_command(message: Message, lang: str):
 
 @commands_router.message(Command("admin"), F.text.regexp(r"/admin (.+)"))
 async def process_admin_command(
-    message: Message, session: AsyncSession, user: User | None, lang: str
+    message: Message,
+    session: AsyncSession,
+    user: UserProfile | None,
+    lang: str,
+    user_profiles: UserProfileCache | None = None,
 ):
     """Handles the /admin command to grant admin rights."""
     password = message.text.split(" ", 1)[1]
@@ -72,8 +72,12 @@ async def process_admin_command(
 
     if password == config.bot.admin_password:
         if not user.is_admin:
-            user.is_admin = True
+            await session.execute(
+                update(User).where(User.user_id == user.user_id).values(is_admin=True)
+            )
             await session.commit()
+            if user_profiles:
+                await user_profiles.store(dataclasses.replace(user, is_admin=True))
             logger.info(f"User {user.telegram_id} has been granted admin rights.")
             await message.answer(lexicon(lang, "admin_grant_success"))
         else:
@@ -46,6 +46,7 @@ LEXICON: dict[str, dict[str, str]] = {
         "admin_already_admin": "Вы уже являетесь администратором.",
         "admin_wrong_password": "❌ Неверный пароль.",
         "admin_not_registered": "Сначала Вам нужно зарегистрироваться в боте через /start.",
+        "not_registered": "Сначала нужно зарегистрироваться через /start.",
         # --- Registration Dialog ---
         "get_name_prompt": "📝 Для начала давай познакомимся. Пожалуйста, отправь свои Фамилию, Имя и Отчество (если есть), например:\n"
         "<i>Иванов Иван Иванович</i>",
@@ -210,6 +211,11 @@ LEXICON: dict[str, dict[str, str]] = {
         "Пора собираться! Не забудь документы.",
         # --- Throttling ---
         "throttling_warning": "Пожалуйста, не так часто! Подожди несколько секунд.",
+        # --- Repeated taps ---
+        "repeat_in_progress": "⏳ Уже выполняю, подожди немного.",
+        "repeat_booking_done": "✅ Запись уже подтверждена.",
+        "repeat_cancel_done": "✅ Запись уже отменена.",
+        "repeat_broadcast_done": "✅ Эта рассылка уже отправлена.",
     }
 }
 
@@ -1,7 +1,19 @@
 from .middlewares import (
+    BotApiMetricsMiddleware,
     DbSessionMiddleware,
     GetLangMiddleware,
-    MessageThrottlingMiddleware,
+    HandlerMetricsMiddleware,
+    ReleaseReadOnlySessionMiddleware,
+    ThrottlingMiddleware,
+    UpdateMetricsMiddleware,
 )
 
-__all__ = ["DbSessionMiddleware", "GetLangMiddleware", "MessageThrottlingMiddleware"]
+__all__ = [
+    "BotApiMetricsMiddleware",
+    "DbSessionMiddleware",
+    "GetLangMiddleware",
+    "HandlerMetricsMiddleware",
+    "ReleaseReadOnlySessionMiddleware",
+    "ThrottlingMiddleware",
+    "UpdateMetricsMiddleware",
+]
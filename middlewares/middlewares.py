@@ -1,39 +1,122 @@
 import time
-from typing import Any, Awaitable, Callable, Dict
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Iterable
 
-from aiogram import BaseMiddleware
-from aiogram.fsm.storage.redis import RedisStorage
-from aiogram.types import Message, TelegramObject, Update
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import (
+    BaseRequestMiddleware,
+    NextRequestMiddlewareType,
+)
+from aiogram.exceptions import TelegramAPIError
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import TelegramObject, Update
 from loguru import logger
-from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
-from sqlalchemy.orm import selectinload
 
-from database.models import User
+from config_data.config import SqlReportConfig, ThrottlingConfig
+from database.session import (
+    WROTE,
+    pin_to_primary,
+    release_read_only_connection,
+)
 from lexicon import DEFAULT_LANG, lexicon
+from services.metrics import (
+    BOT_API_ERRORS,
+    BOT_API_SECONDS,
+    DB_QUERIES_PER_UPDATE,
+    HANDLER_SECONDS,
+    MIDDLEWARE_SECONDS,
+    UPDATE_SECONDS,
+    UPDATES,
+    UpdateStats,
+    current_update_stats,
+)
+from services.rate_limiter import RateDecision, RateLimiter
+from services.read_your_writes import ReadYourWritesGuard
+from services.tracing import KIND_CLIENT, traced, tracer
+from services.user_profiles import UserProfileCache, load_profile
+
+# Statements listed in a per-update SQL report, besides repeated ones
+SQL_REPORT_TOP = 5
+
+# The session of the update being handled, for the Telegram request middleware
+current_session: ContextVar[AsyncSession | None] = ContextVar(
+    "current_session", default=None
+)
 
 
 class DbSessionMiddleware(BaseMiddleware):
-    """Provides a database session to the handler."""
+    """
+    Provides a database session to the handler.
 
-    def __init__(self, session_pool: async_sessionmaker[AsyncSession]):
+    The session checks out a connection only on its first query, so updates
+    that never touch the database never take one from the pool. With a read
+    replica, a user's updates right after one that wrote are kept on the
+    primary by the read-your-writes guard.
+    """
+
+    def __init__(
+        self,
+        session_pool: async_sessionmaker[AsyncSession],
+        guard: ReadYourWritesGuard | None = None,
+    ):
         super().__init__()
         self.session_pool = session_pool
+        self.guard = guard
 
+    @traced("DbSessionMiddleware")
     async def __call__(
         self,
         handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
         event: TelegramObject,
         data: Dict[str, Any],
     ) -> Any:
+        user = data.get("event_from_user")
+        guard = self.guard if user else None
         async with self.session_pool() as session:
+            if guard and await guard.is_recent_writer(user.id):
+                pin_to_primary(session)
             data["session"] = session
-            return await handler(event, data)
+            token = current_session.set(session)
+            try:
+                return await handler(event, data)
+            finally:
+                current_session.reset(token)
+                if guard and session.info.get(WROTE):
+                    await guard.mark_writer(user.id)
+
+
+class ReleaseReadOnlySessionMiddleware(BaseRequestMiddleware):
+    """
+    Returns a read-only update's connection to the pool before each Telegram
+    API call, so connections are not held during network round trips.
+    """
+
+    @traced("ReleaseReadOnlySessionMiddleware")
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        session = current_session.get()
+        if session is not None:
+            await release_read_only_connection(session)
+        return await make_request(bot, method)
 
 
 class GetLangMiddleware(BaseMiddleware):
-    """Determines the user's language and adds the user object to the data."""
+    """
+    Determines the user's language and adds the user's profile to the data.
+    Profiles come from the profile cache if one is given, else from the DB.
+    """
+
+    def __init__(self, profiles: UserProfileCache | None = None):
+        super().__init__()
+        self.profiles = profiles
 
+    @traced("GetLangMiddleware")
     async def __call__(
         self,
         handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
@@ -46,47 +129,194 @@ class GetLangMiddleware(BaseMiddleware):
         db_user = None
 
         if user:
-            # Eagerly load the faculty and booking relationships
-            stmt = (
-                select(User)
-                .where(User.telegram_id == user.id)
-                .options(selectinload(User.faculty), selectinload(User.booking))
-            )
-            db_user = await session.scalar(stmt)
+            if self.profiles:
+                db_user = await self.profiles.get(session, user.id)
+            else:
+                db_user = await load_profile(session, user.id)
             if db_user:
                 lang_code = db_user.lang if db_user.lang else DEFAULT_LANG
             elif user.language_code == "ru":
                 lang_code = "ru"
 
         data["lang"] = lang_code
-        data["user"] = db_user  # Add user object to data for easy access
+        data["user"] = db_user  # Add user profile to data for easy access
         return await handler(event, data)
 
 
-class MessageThrottlingMiddleware(BaseMiddleware):
-    def __init__(self, storage: RedisStorage):
-        self.storage = storage
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Rate limits messages and callback queries per user before any other work.
+
+    Registered as the first update middleware, so rejected updates never get
+    a database session. Admins from the config have their own budget. The
+    first rejection gets a warning, the rest are dropped silently. Callback
+    queries are always answered, so the button's spinner stops.
+    """
 
+    def __init__(
+        self,
+        limiter: RateLimiter,
+        limits: ThrottlingConfig,
+        admin_ids: Iterable[int] = (),
+    ):
+        super().__init__()
+        self.limiter = limiter
+        self.limits = limits
+        self.admin_ids = frozenset(admin_ids)
+
+    @traced("ThrottlingMiddleware")
     async def __call__(
         self,
-        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
-        event: Message,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        if not user or not (event.message or event.callback_query):
+            return await handler(event, data)
+
+        if user.id in self.admin_ids:
+            kind, limit = "admin", self.limits.admin
+        elif event.message:
+            kind, limit = "message", self.limits.messages
+        else:
+            kind, limit = "callback", self.limits.callbacks
+
+        decision = await self.limiter.hit(kind, user.id, limit)
+        if decision == RateDecision.ALLOWED:
+            return await handler(event, data)
+
+        logger.debug(f"Throttled {kind} from user {user.id}.")
+        text = None
+        if decision == RateDecision.REJECTED_FIRST:
+            # The profile is not loaded yet, so use the client language
+            lang = "ru" if user.language_code == "ru" else DEFAULT_LANG
+            text = lexicon(lang, "throttling_warning")
+        if event.callback_query:
+            await event.callback_query.answer(text)
+        elif text:
+            await event.message.answer(text)
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """
+    Counts updates by type and records their latency and number of queries.
+
+    Registered as the outermost update middleware, so the latency covers
+    every other middleware. `HandlerMetricsMiddleware` reports the handler's
+    share of it. With a report config, updates over its limits or repeating
+    a statement get their SQL logged, to find queries worth batching.
+    """
+
+    def __init__(self, sql_report: SqlReportConfig | None = None):
+        super().__init__()
+        self.sql_report = sql_report
+
+    @traced("UpdateMetricsMiddleware")
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
         data: Dict[str, Any],
     ) -> Any:
+        update_type = event.event_type
+        stats = UpdateStats()
+        token = current_update_stats.set(stats)
+        status = "error"
+        started = time.perf_counter()
+        try:
+            result = await handler(event, data)
+            status = "ok"
+            return result
+        finally:
+            elapsed = time.perf_counter() - started
+            current_update_stats.reset(token)
+            UPDATES.labels(update_type, status).inc()
+            UPDATE_SECONDS.labels(update_type).observe(elapsed)
+            DB_QUERIES_PER_UPDATE.labels(update_type).observe(stats.queries)
+            if stats.handler_seconds is not None:
+                HANDLER_SECONDS.labels(update_type).observe(stats.handler_seconds)
+                MIDDLEWARE_SECONDS.labels(update_type).observe(
+                    elapsed - stats.handler_seconds
+                )
+            if self.sql_report and stats.queries:
+                self._report_sql(event, stats, elapsed)
+
+    def _report_sql(self, event: Update, stats: UpdateStats, elapsed: float) -> None:
+        limits = self.sql_report
+        repeated = {
+            statement
+            for statement, count in stats.statements.items()
+            if count >= limits.max_repeats
+        }
+        if (
+            not repeated
+            and stats.queries <= limits.max_queries
+            and stats.db_seconds * 1000 <= limits.max_ms
+        ):
+            return
+
+        lines = [
+            f"Update {event.update_id} ({event.event_type}) ran {stats.queries} "
+            f"SQL statements in {stats.db_seconds * 1000:.1f} ms "
+            f"of {elapsed * 1000:.1f} ms"
+            + (f", {len(repeated)} repeated" if repeated else "")
+            + ":"
+        ]
+        slowest = {
+            statement
+            for statement, _ in stats.statement_seconds.most_common(SQL_REPORT_TOP)
+        }
+        for statement, seconds in stats.statement_seconds.most_common():
+            if statement not in slowest and statement not in repeated:
+                continue
+            flag = " [repeated]" if statement in repeated else ""
+            sql = " ".join(statement.split())
+            lines.append(
+                f"  {stats.statements[statement]}x {seconds * 1000:.1f} ms{flag} "
+                f"{sql[:160]}"
+            )
+        logger.warning("\n".join(lines))
+
 
-        user = str(event.from_user.id)
-        check_user = await self.storage.redis.get(name=user)
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """
+    Times the handler of an event. Registered as an inner middleware, so it
+    only runs once filters have matched a handler.
+    """
 
-        if check_user:
-            if int(check_user.decode()) == 1:
-                await self.storage.redis.set(name=user, value=2, ex=3)
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        started = time.perf_counter()
+        try:
+            with tracer.span("handler"):
                 return await handler(event, data)
-            elif int(check_user.decode()) == 2:
-                await self.storage.redis.set(name=user, value=3, ex=10)
-                lang = data.get("lang", DEFAULT_LANG)
-                return await event.answer(lexicon(lang, "throttling_warning"))
-            elif int(check_user.decode()) == 3:
-                return
-
-        await self.storage.redis.set(name=user, value=1, ex=3)
-        return await handler(event, data)
+        finally:
+            stats = current_update_stats.get()
+            if stats is not None:
+                stats.handler_seconds = time.perf_counter() - started
+
+
+class BotApiMetricsMiddleware(BaseRequestMiddleware):
+    """Records the latency and errors of Telegram Bot API calls by method."""
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        api_method = method.__api_method__
+        started = time.perf_counter()
+        try:
+            with tracer.span(f"bot_api {api_method}", kind=KIND_CLIENT):
+                return await make_request(bot, method)
+        except TelegramAPIError as e:
+            BOT_API_ERRORS.labels(api_method, e.__class__.__name__).inc()
+            raise
+        finally:
+            BOT_API_SECONDS.labels(api_method).observe(time.perf_counter() - started)
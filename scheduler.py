@@ -6,9 +6,10 @@ from aiogram import Bot
 from aiogram.client.bot import DefaultBotProperties
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from loguru import logger
-from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 
 from config_data import config
+from database.engine import create_engines
+from database.session import create_session_maker
 from services import send_notifications, setup_logger
 
 
@@ -20,12 +21,9 @@ async def main() -> None:
     bot = Bot(token=config.bot.token, default=DefaultBotProperties(parse_mode="HTML"))
 
     # --- Database Initialization ---
-    engine = create_async_engine(
-        url=config.db.url,
-        echo=False,
-        pool_pre_ping=True,
-    )
-    session_maker = async_sessionmaker(engine, expire_on_commit=False)
+    # Notification scans only read, so they can run on the replica
+    engine, replica_engine = create_engines(config.db)
+    session_maker = create_session_maker(engine, replica_engine)
 
     # --- Scheduler Setup ---
     scheduler = AsyncIOScheduler(timezone=ZoneInfo("Europe/Moscow"))
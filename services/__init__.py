@@ -6,27 +6,67 @@ from .admin_actions import (
     get_statistics,
     update_schedule_exception,
 )
+from .availability_cache import AvailabilityCache
+from .event_isolation import LeasedRedisEventIsolation
+from .exception_index import exception_index
+from .health import HealthMonitor
+from .idempotency import IdempotencyGuard
 from .initial_data_service import (
+    bootstrap_database,
     populate_initial_faculties,
     populate_initial_lastday,
     populate_initial_timetable,
 )
+from .invalidation import invalidation_bus
 from .logger import setup_logger
+from .metrics import InstrumentedConnection, instrument_engine
 from .notification_service import send_notifications
+from .rate_limiter import RateLimiter
+from .read_your_writes import ReadYourWritesGuard
+from .reference_data import REFERENCE_DATA_TOPIC, reference_data
 from .report_service import generate_excel_report
 from .schedule_service import (
     cancel_booking,
     create_booking,
     get_available_slots,
+    get_days_availability,
     get_user_booking,
 )
+from .slot_holds import SlotHolds
+from .tracing import traced, tracer
+from .update_dedup import UpdateDeduplicator
+from .update_queue import QueuedRequestHandler
+from .user_profiles import UserProfile, UserProfileCache
+from .webhook import ensure_webhook
 
 __all__ = [
+    "AvailabilityCache",
+    "HealthMonitor",
+    "IdempotencyGuard",
+    "InstrumentedConnection",
+    "LeasedRedisEventIsolation",
+    "QueuedRequestHandler",
+    "RateLimiter",
+    "ReadYourWritesGuard",
+    "SlotHolds",
+    "UpdateDeduplicator",
+    "UserProfile",
+    "UserProfileCache",
+    "ensure_webhook",
+    "exception_index",
+    "instrument_engine",
+    "invalidation_bus",
+    "traced",
+    "tracer",
+    "reference_data",
+    "REFERENCE_DATA_TOPIC",
     "setup_logger",
+    "bootstrap_database",
     "populate_initial_faculties",
     "populate_initial_timetable",
     "populate_initial_lastday",
     "get_available_slots",
+    "get_days_availability",
     "create_booking",
     "get_user_booking",
     "cancel_booking",
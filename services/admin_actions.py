@@ -8,6 +8,11 @@ from sqlalchemy import func, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from database.models import ScheduleException, User
+from database.session import pin_to_primary
+
+from .availability_cache import AvailabilityCache
+from .exception_index import SCHEDULE_EXCEPTIONS_TOPIC
+from .invalidation import invalidation_bus
 
 
 async def get_statistics(session: AsyncSession) -> dict[str, int]:
@@ -69,6 +74,7 @@ async def create_non_working_day(
     session: AsyncSession,
     date: datetime.date,
     description: str,
+    cache: AvailabilityCache | None = None,
 ):
     """
     Creates a high-priority exception to make a specific date non-working.
@@ -77,6 +83,7 @@ async def create_non_working_day(
         session: The database session.
         date: The date to make non-working.
         description: A description for the exception.
+        cache: The availability cache to invalidate for this date.
     """
     exception = ScheduleException(
         description=description,
@@ -88,10 +95,15 @@ async def create_non_working_day(
     )
     session.add(exception)
     await session.commit()
+    await invalidation_bus.publish(SCHEDULE_EXCEPTIONS_TOPIC)
+    if cache:
+        await cache.invalidate_date(date)
 
 
 async def create_schedule_exception(
-    session: AsyncSession, data: Dict[str, Any]
+    session: AsyncSession,
+    data: Dict[str, Any],
+    cache: AvailabilityCache | None = None,
 ) -> ScheduleException:
     """
     Creates a new schedule exception rule from dialog data.
@@ -99,6 +111,7 @@ async def create_schedule_exception(
     Args:
         session: The database session.
         data: The data collected from the dialog manager.
+        cache: The availability cache to invalidate.
 
     Returns:
         The created ScheduleException object.
@@ -136,11 +149,17 @@ async def create_schedule_exception(
     )
     session.add(new_exception)
     await session.commit()
+    await invalidation_bus.publish(SCHEDULE_EXCEPTIONS_TOPIC)
+    if cache:
+        await cache.invalidate_all()
     return new_exception
 
 
 async def update_schedule_exception(
-    session: AsyncSession, exception_id: int, data: Dict[str, Any]
+    session: AsyncSession,
+    exception_id: int,
+    data: Dict[str, Any],
+    cache: AvailabilityCache | None = None,
 ) -> ScheduleException | None:
     """
     Updates an existing schedule exception rule from dialog data.
@@ -149,10 +168,13 @@ async def update_schedule_exception(
         session: The database session.
         exception_id: The ID of the exception to update.
         data: The data collected from the dialog manager.
+        cache: The availability cache to invalidate.
 
     Returns:
         The updated ScheduleException object or None if not found.
     """
+    # The rule is written back, so it must not come from a lagging replica
+    pin_to_primary(session)
     exc = await session.get(ScheduleException, exception_id)
     if not exc:
         return None
@@ -186,23 +208,35 @@ async def update_schedule_exception(
     exc.start_window_override = data.get("start_window")
 
     await session.commit()
+    await invalidation_bus.publish(SCHEDULE_EXCEPTIONS_TOPIC)
+    if cache:
+        await cache.invalidate_all()
     return exc
 
 
-async def delete_schedule_exception(session: AsyncSession, exception_id: int) -> bool:
+async def delete_schedule_exception(
+    session: AsyncSession,
+    exception_id: int,
+    cache: AvailabilityCache | None = None,
+) -> bool:
     """
     Deletes a schedule exception by its ID.
 
     Args:
         session: The database session.
         exception_id: The ID of the exception to delete.
+        cache: The availability cache to invalidate.
 
     Returns:
         True if deletion was successful, False otherwise.
     """
+    pin_to_primary(session)
     exception = await session.get(ScheduleException, exception_id)
     if exception:
         await session.delete(exception)
         await session.commit()
+        await invalidation_bus.publish(SCHEDULE_EXCEPTIONS_TOPIC)
+        if cache:
+            await cache.invalidate_all()
         return True
     return False
@@ -0,0 +1,153 @@
+import datetime
+from typing import Iterable
+
+from loguru import logger
+from redis.asyncio import Redis
+from redis.asyncio.client import Pipeline
+
+AVAILABILITY_TTL = 300  # seconds
+KEY_PREFIX = "availability"
+# Years of study go up to 6 (specialist); bucket 0 holds users without a year.
+YEAR_BUCKETS = range(0, 7)
+# Keeps fully booked or non-working days cached, since Redis drops empty sets.
+EMPTY_MARKER = b"-"
+# Bumped by every change, so a computation that raced one is not stored
+VERSION_PREFIX = "availability_version"
+VERSION_TTL = 86400  # seconds
+
+# KEYS: slots key, date version key, global version key
+# ARGV: date version, global version, ttl, members...
+STORE_SCRIPT = """
+if (redis.call('GET', KEYS[2]) or '0') ~= ARGV[1]
+    or (redis.call('GET', KEYS[3]) or '0') ~= ARGV[2] then
+    return 0
+end
+redis.call('DEL', KEYS[1])
+redis.call('SADD', KEYS[1], unpack(ARGV, 4))
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return 1
+"""
+
+
+def year_bucket(year: int | None) -> int:
+    """Maps a year of study to its cache bucket."""
+    return year if year in YEAR_BUCKETS else 0
+
+
+class AvailabilityCache:
+    """
+    Shared Redis cache of computed free slots.
+
+    Each (date, window, year bucket) is stored as a Redis set of naive
+    Moscow-time ISO strings, so every bot replica serves the time picker
+    from the same data. Bookings patch the set, cancellations and schedule
+    changes invalidate it.
+
+    Every change also bumps a per-date version (a global one for
+    `invalidate_all`). Callers read the version before computing the slots
+    and `store` only writes them if it is unchanged, so a computation that
+    started before a change cannot put stale slots back.
+    """
+
+    def __init__(self, redis: Redis, ttl: int = AVAILABILITY_TTL):
+        self.redis = redis
+        self.ttl = ttl
+        self._store = redis.register_script(STORE_SCRIPT)
+
+    @staticmethod
+    def _key(target_date: datetime.date, window: int, bucket: int) -> str:
+        return f"{KEY_PREFIX}:{target_date.isoformat()}:{window}:{bucket}"
+
+    def _date_keys(self, target_date: datetime.date, window: int) -> list[str]:
+        return [self._key(target_date, window, bucket) for bucket in YEAR_BUCKETS]
+
+    @staticmethod
+    def _version_keys(target_date: datetime.date) -> list[str]:
+        return [f"{VERSION_PREFIX}:{target_date.isoformat()}", VERSION_PREFIX]
+
+    async def get(
+        self, target_date: datetime.date, window: int, year: int | None
+    ) -> list[datetime.datetime] | None:
+        """
+        Returns the cached free slots, or None on a cache miss.
+        """
+        members = await self.redis.smembers(
+            self._key(target_date, window, year_bucket(year))
+        )
+        if not members:
+            return None
+        return sorted(
+            datetime.datetime.fromisoformat(member.decode())
+            for member in members
+            if member != EMPTY_MARKER
+        )
+
+    async def version(self, target_date: datetime.date) -> list[str]:
+        """Returns the version of a date, to be read before computing its slots."""
+        values = await self.redis.mget(self._version_keys(target_date))
+        return [value.decode() if value else "0" for value in values]
+
+    async def store(
+        self,
+        target_date: datetime.date,
+        window: int,
+        year: int | None,
+        slots: Iterable[datetime.datetime],
+        version: list[str],
+    ) -> bool:
+        """
+        Stores the computed free slots for a date, window and year bucket,
+        unless the date changed since `version` was read.
+        """
+        stored = await self._store(
+            keys=[
+                self._key(target_date, window, year_bucket(year)),
+                *self._version_keys(target_date),
+            ],
+            args=[
+                *version,
+                self.ttl,
+                EMPTY_MARKER,
+                *(slot.isoformat() for slot in slots),
+            ],
+        )
+        if not stored:
+            logger.debug(f"Slots for {target_date} changed while computed, not cached.")
+        return bool(stored)
+
+    async def discard_slot(self, slot: datetime.datetime, window: int) -> None:
+        """Removes a freshly booked slot from every year bucket of its date."""
+        member = slot.replace(tzinfo=None).isoformat()
+        async with self.redis.pipeline(transaction=False) as pipe:
+            self._bump_version(pipe, slot.date())
+            for key in self._date_keys(slot.date(), window):
+                pipe.srem(key, member)
+            await pipe.execute()
+
+    async def invalidate_date(
+        self, target_date: datetime.date, window: int | None = None
+    ) -> None:
+        """Drops cached slots for a date, either for one window or for all."""
+        async with self.redis.pipeline(transaction=False) as pipe:
+            self._bump_version(pipe, target_date)
+            if window is not None:
+                pipe.unlink(*self._date_keys(target_date, window))
+            await pipe.execute()
+        if window is None:
+            await self._unlink_matching(f"{KEY_PREFIX}:{target_date.isoformat()}:*")
+
+    async def invalidate_all(self) -> None:
+        """Drops every cached date, e.g. after a schedule rule change."""
+        await self.redis.incr(VERSION_PREFIX)
+        await self._unlink_matching(f"{KEY_PREFIX}:*")
+        logger.debug("Availability cache invalidated.")
+
+    def _bump_version(self, pipe: Pipeline, target_date: datetime.date) -> None:
+        key = self._version_keys(target_date)[0]
+        pipe.incr(key)
+        pipe.expire(key, VERSION_TTL)
+
+    async def _unlink_matching(self, pattern: str) -> None:
+        keys = [key async for key in self.redis.scan_iter(match=pattern, count=500)]
+        if keys:
+            await self.redis.unlink(*keys)
@@ -0,0 +1,83 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator
+
+from aiogram.dispatcher.event.bases import CancelHandler
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.redis import KeyBuilder, RedisEventIsolation
+from loguru import logger
+from redis.asyncio import Redis
+from redis.asyncio.lock import Lock
+from redis.exceptions import LockError, RedisError
+
+from .metrics import EVENT_LOCK_LOST, EVENT_LOCK_TIMEOUTS, EVENT_LOCK_WAIT_SECONDS
+
+LEASE = 10  # seconds
+# After this long the update is dropped rather than waiting on
+WAIT_TIMEOUT = 30  # seconds
+
+
+class LeasedRedisEventIsolation(RedisEventIsolation):
+    """
+    Serializes the updates of one FSM key across all replicas.
+
+    The Redis lock is taken with a short lease that is renewed while the
+    update runs, so a crashed replica holds a user's dialog for seconds
+    rather than a minute, and long handlers keep their lock. The time spent
+    waiting for the lock is exported as a metric. An update that cannot get
+    the lock is dropped with CancelHandler, never processed unlocked.
+    """
+
+    def __init__(
+        self,
+        redis: Redis,
+        key_builder: KeyBuilder | None = None,
+        lease: float = LEASE,
+        wait_timeout: float = WAIT_TIMEOUT,
+    ):
+        super().__init__(
+            redis,
+            key_builder,
+            lock_kwargs={"timeout": lease, "blocking_timeout": wait_timeout},
+        )
+        self.lease = lease
+
+    @asynccontextmanager
+    async def lock(self, key: StorageKey) -> AsyncGenerator[None, None]:
+        redis_key = self.key_builder.build(key, "lock")
+        lock = self.redis.lock(name=redis_key, lock_class=Lock, **self.lock_kwargs)
+        started = time.perf_counter()
+        try:
+            acquired = await lock.acquire()
+        except RedisError:
+            logger.exception(f"Could not take the lock {redis_key}.")
+            acquired = False
+        EVENT_LOCK_WAIT_SECONDS.observe(time.perf_counter() - started)
+        if not acquired:
+            EVENT_LOCK_TIMEOUTS.inc()
+            logger.warning(f"Dropping the update, could not take the lock {redis_key}.")
+            raise CancelHandler()
+
+        renewal = asyncio.create_task(self._renew(lock))
+        try:
+            yield None
+        finally:
+            renewal.cancel()
+            try:
+                await lock.release()
+            except LockError:
+                EVENT_LOCK_LOST.inc()
+                logger.warning(f"The lock {redis_key} expired before release.")
+            except RedisError:
+                logger.exception(f"Could not release the lock {redis_key}.")
+
+    async def _renew(self, lock: Lock) -> None:
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            try:
+                await lock.reacquire()
+            except LockError:
+                return
+            except RedisError:
+                logger.exception(f"Could not renew the lock {lock.name}.")
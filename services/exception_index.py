@@ -0,0 +1,210 @@
+import asyncio
+import bisect
+import datetime
+from dataclasses import dataclass
+from typing import Iterable
+
+from loguru import logger
+from sqlalchemy import desc, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import ScheduleException
+
+from .invalidation import invalidation_bus
+
+SCHEDULE_EXCEPTIONS_TOPIC = "schedule_exceptions"
+
+
+@dataclass(frozen=True)
+class ExceptionRule:
+    """An immutable snapshot of an active ScheduleException."""
+
+    exception_id: int
+    start_date: datetime.date
+    end_date: datetime.date | None
+    priority: int
+    is_non_working: bool
+    target_days_of_week: frozenset[int] | None
+    target_start_time: datetime.time | None
+    new_start_time: datetime.time | None
+    new_end_time: datetime.time | None
+    start_window_override: int | None
+    allowed_years: frozenset[int] | None
+    block_others_if_years_mismatch: bool
+
+    @classmethod
+    def from_model(cls, exc: ScheduleException) -> "ExceptionRule":
+        return cls(
+            exception_id=exc.exception_id,
+            start_date=exc.start_date,
+            end_date=exc.end_date,
+            priority=exc.priority,
+            is_non_working=exc.is_non_working,
+            target_days_of_week=(
+                frozenset(exc.target_days_of_week) if exc.target_days_of_week else None
+            ),
+            target_start_time=exc.target_start_time,
+            new_start_time=exc.new_start_time,
+            new_end_time=exc.new_end_time,
+            start_window_override=exc.start_window_override,
+            allowed_years=frozenset(exc.allowed_years) if exc.allowed_years else None,
+            block_others_if_years_mismatch=exc.block_others_if_years_mismatch,
+        )
+
+
+@dataclass(frozen=True)
+class DayRules:
+    """The resolved rules of a date for one year of study."""
+
+    is_blocked: bool
+    # Modification rules in priority order, already filtered by weekday and year
+    modifiers: tuple[ExceptionRule, ...]
+
+
+@dataclass(frozen=True)
+class _Segment:
+    """Rules covering an interval of dates with no rule boundary inside."""
+
+    is_non_working: bool
+    # Years allowed by all 'exclusive' rules, or None if there are no such rules
+    exclusive_years: frozenset[int] | None
+    # Applicable rules per weekday (Monday=0), highest priority first
+    rules_by_weekday: tuple[tuple[ExceptionRule, ...], ...]
+
+
+NO_RULES = DayRules(is_blocked=False, modifiers=())
+
+
+class ScheduleExceptionIndex:
+    """
+    In-process interval index of active schedule exceptions.
+
+    The rule set is loaded in one query and compiled into date segments,
+    with the priority order and weekday filtering resolved up front. A
+    lookup for a (date, year) is then a bisect plus a memoized filter.
+    The index is rebuilt lazily after `invalidate()`, which every replica
+    receives through the invalidation bus.
+    """
+
+    def __init__(self):
+        self._bounds: list[datetime.date] = []
+        self._segments: list[_Segment] = []
+        self._memo: dict[tuple[int, int, int | None], DayRules] = {}
+        self._generation = 0
+        self._loaded_generation = -1
+        self._lock = asyncio.Lock()
+
+    @property
+    def is_stale(self) -> bool:
+        return self._loaded_generation != self._generation
+
+    def invalidate(self) -> None:
+        """Marks the index for a rebuild on next use."""
+        self._generation += 1
+
+    async def ensure_loaded(self, session: AsyncSession) -> None:
+        """Rebuilds the index from the database if it is stale."""
+        if not self.is_stale:
+            return
+        async with self._lock:
+            if not self.is_stale:
+                return
+            generation = self._generation
+            stmt = (
+                select(ScheduleException)
+                .where(ScheduleException.is_active == True)
+                .order_by(
+                    desc(ScheduleException.priority), ScheduleException.exception_id
+                )
+                # A lagging replica would pin a stale rule set until the next change
+                .execution_options(use_primary=True)
+            )
+            exceptions = (await session.scalars(stmt)).all()
+            self.compile(exceptions)
+            # An invalidation during the load leaves the index stale
+            self._loaded_generation = generation
+            logger.debug(
+                f"Schedule exception index rebuilt with {len(exceptions)} rules."
+            )
+
+    def compile(self, exceptions: Iterable[ScheduleException]) -> None:
+        """Compiles active exceptions into date segments."""
+        rules = sorted(
+            (ExceptionRule.from_model(exc) for exc in exceptions if exc.is_active),
+            key=lambda rule: -rule.priority,
+        )
+
+        bounds = set()
+        for rule in rules:
+            bounds.add(rule.start_date)
+            if rule.end_date and rule.end_date < datetime.date.max:
+                bounds.add(rule.end_date + datetime.timedelta(days=1))
+
+        sorted_bounds = sorted(bounds)
+        segments = []
+        for segment_start in sorted_bounds:
+            covering = [
+                rule
+                for rule in rules
+                if rule.start_date <= segment_start
+                and (rule.end_date is None or rule.end_date >= segment_start)
+            ]
+            exclusive = [
+                rule.allowed_years
+                for rule in covering
+                if rule.block_others_if_years_mismatch and rule.allowed_years
+            ]
+            segments.append(
+                _Segment(
+                    is_non_working=any(rule.is_non_working for rule in covering),
+                    exclusive_years=(
+                        frozenset.intersection(*exclusive) if exclusive else None
+                    ),
+                    rules_by_weekday=tuple(
+                        tuple(
+                            rule
+                            for rule in covering
+                            if not rule.target_days_of_week
+                            or weekday in rule.target_days_of_week
+                        )
+                        for weekday in range(7)
+                    ),
+                )
+            )
+
+        self._bounds = sorted_bounds
+        self._segments = segments
+        self._memo = {}
+
+    def rules_for(self, target_date: datetime.date, year: int | None) -> DayRules:
+        """Returns the resolved rules of a date for a year of study."""
+        position = bisect.bisect_right(self._bounds, target_date) - 1
+        if position < 0:
+            return NO_RULES
+
+        key = (position, target_date.weekday(), year)
+        day_rules = self._memo.get(key)
+        if day_rules is None:
+            segment = self._segments[position]
+            is_blocked = segment.is_non_working or (
+                segment.exclusive_years is not None
+                and year not in segment.exclusive_years
+            )
+            day_rules = DayRules(
+                is_blocked=is_blocked,
+                modifiers=(
+                    ()
+                    if is_blocked
+                    else tuple(
+                        rule
+                        for rule in segment.rules_by_weekday[target_date.weekday()]
+                        if not rule.allowed_years or year in rule.allowed_years
+                    )
+                ),
+            )
+            self._memo[key] = day_rules
+        return day_rules
+
+
+exception_index = ScheduleExceptionIndex()
+invalidation_bus.subscribe(SCHEDULE_EXCEPTIONS_TOPIC, exception_index.invalidate)
@@ -0,0 +1,149 @@
+import asyncio
+import datetime
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable
+
+from loguru import logger
+
+from .metrics import DEPENDENCY_LATENCY_SECONDS, DEPENDENCY_UP
+
+CHECK_INTERVAL = 10  # seconds
+CHECK_TIMEOUT = 5  # seconds
+# A dependency whose last check is older than this many intervals is not ready
+STALE_INTERVALS = 3
+# A dependency turns not ready after this many consecutive failed checks, so
+# a single blip does not take every replica out of the Service at once
+FAILURE_THRESHOLD = 3
+# Failing dependencies are re-checked this often, whatever their interval
+RETRY_INTERVAL = 10  # seconds
+
+
+@dataclass
+class HealthCheck:
+    """A dependency probe and how often to run it."""
+
+    name: str
+    probe: Callable[[], Awaitable[Any]]
+    interval: float = CHECK_INTERVAL
+
+
+@dataclass
+class DependencyStatus:
+    """The outcome of the last check of a dependency."""
+
+    ok: bool = False  # The last check passed
+    # Passed once, and failed fewer than FAILURE_THRESHOLD times in a row since
+    healthy: bool = False
+    latency_ms: float | None = None
+    checked_at: datetime.datetime | None = None
+    error: str | None = None
+    failures: int = 0  # Consecutive failed checks
+    _checked_monotonic: float = 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "ok": self.ok,
+            "healthy": self.healthy,
+            "latency_ms": self.latency_ms,
+            "checked_at": self.checked_at.isoformat() if self.checked_at else None,
+            "error": self.error,
+            "failures": self.failures,
+        }
+
+
+class HealthMonitor:
+    """
+    Checks dependencies in the background, each on its own cadence.
+
+    Probe endpoints read the last known state instead of calling Telegram,
+    the database and Redis themselves, so they answer instantly and a slow
+    dependency cannot make the probe time out. A failing dependency is
+    re-checked every RETRY_INTERVAL and only reported as not ready after
+    FAILURE_THRESHOLD failures in a row.
+    """
+
+    def __init__(self, timeout: float = CHECK_TIMEOUT):
+        self.timeout = timeout
+        self.checks: list[HealthCheck] = []
+        self.status: dict[str, DependencyStatus] = {}
+        self._tasks: list[asyncio.Task] = []
+
+    def add(
+        self,
+        name: str,
+        probe: Callable[[], Awaitable[Any]],
+        interval: float = CHECK_INTERVAL,
+    ) -> None:
+        """Registers a dependency probe."""
+        self.checks.append(HealthCheck(name, probe, interval))
+        self.status[name] = DependencyStatus()
+
+    @property
+    def ready(self) -> bool:
+        """Whether every dependency is healthy and was checked recently."""
+        now = time.monotonic()
+        return all(
+            self.status[check.name].healthy
+            and now - self.status[check.name]._checked_monotonic
+            <= check.interval * STALE_INTERVALS
+            for check in self.checks
+        )
+
+    def details(self) -> dict:
+        return {
+            "ready": self.ready,
+            "dependencies": {
+                name: status.to_dict() for name, status in self.status.items()
+            },
+        }
+
+    async def start(self) -> None:
+        """Runs every check once, then keeps checking in the background."""
+        await asyncio.gather(*(self._check(check) for check in self.checks))
+        self._tasks = [asyncio.create_task(self._run(check)) for check in self.checks]
+
+    async def stop(self) -> None:
+        """Stops the background checks."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _run(self, check: HealthCheck) -> None:
+        while True:
+            status = self.status[check.name]
+            await asyncio.sleep(
+                min(check.interval, RETRY_INTERVAL)
+                if status.failures
+                else check.interval
+            )
+            await self._check(check)
+
+    async def _check(self, check: HealthCheck) -> None:
+        status = self.status[check.name]
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(check.probe(), self.timeout)
+        except Exception as e:
+            error = f"{e.__class__.__name__}: {e}" if str(e) else e.__class__.__name__
+            if not status.failures:
+                logger.error(f"Health check '{check.name}' failed: {error}")
+            status.ok = False
+            status.error = error
+            status.failures += 1
+            if status.failures >= FAILURE_THRESHOLD:
+                status.healthy = False
+        else:
+            if status.failures:
+                logger.info(f"Health check '{check.name}' recovered.")
+            status.ok = True
+            status.healthy = True
+            status.error = None
+            status.failures = 0
+        elapsed = time.perf_counter() - started
+        status.latency_ms = round(elapsed * 1000, 1)
+        status.checked_at = datetime.datetime.now(datetime.timezone.utc)
+        status._checked_monotonic = time.monotonic()
+        DEPENDENCY_UP.labels(check.name).set(status.ok)
+        DEPENDENCY_LATENCY_SECONDS.labels(check.name).observe(elapsed)
@@ -0,0 +1,116 @@
+import functools
+from typing import Awaitable, Callable
+
+from aiogram.types import CallbackQuery
+from aiogram_dialog import DialogManager
+from loguru import logger
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from lexicon import lexicon
+
+KEY_PREFIX = "idempotency"
+OUTCOME_TTL = 30  # seconds
+# Stored while the first call runs, outcomes are stored in its place
+PENDING = "\0"
+
+
+class IdempotencyGuard:
+    """
+    Remembers the outcome of an action for a short window, across replicas.
+
+    The first call claims the key with SET NX and later stores its outcome
+    in its place. Calls with a claimed key get the stored outcome, or None
+    while the first call is still running (or once its claim expired).
+    """
+
+    def __init__(self, redis: Redis, ttl: int = OUTCOME_TTL):
+        self.redis = redis
+        self.ttl = ttl
+
+    async def claim(self, key: str, ttl: int | None = None) -> tuple[bool, str | None]:
+        """Returns (True, None) for the first call, else (False, its outcome)."""
+        key = f"{KEY_PREFIX}:{key}"
+        if await self.redis.set(key, PENDING, nx=True, ex=ttl or self.ttl):
+            return True, None
+        outcome = await self.redis.get(key)
+        if outcome is None or outcome.decode() == PENDING:
+            return False, None
+        return False, outcome.decode()
+
+    async def store(self, key: str, outcome: str) -> None:
+        """Replaces a claim with the action's outcome."""
+        await self.redis.set(f"{KEY_PREFIX}:{key}", outcome, ex=self.ttl)
+
+    async def release(self, key: str) -> None:
+        """Drops a claim, so a failed action can be retried."""
+        await self.redis.delete(f"{KEY_PREFIX}:{key}")
+
+
+def idempotent(
+    payload: Callable[[DialogManager], str] | None = None,
+    ttl: int | None = None,
+) -> Callable:
+    """
+    Makes a dialog button handler run once per user, dialog intent and
+    payload, however many times the button is tapped.
+
+    The handler returns a short text describing its outcome. Repeated taps
+    get that text in the callback answer, without running the handler, so
+    they touch neither the database nor the Bot API. `ttl` must cover the
+    handler's run time if it is longer than the outcome window.
+    Without an "idempotency" guard in the middleware data, the handler
+    runs as usual.
+    """
+
+    def decorator(
+        handler: Callable[..., Awaitable[str | None]],
+    ) -> Callable[..., Awaitable[None]]:
+        @functools.wraps(handler)
+        async def wrapper(
+            callback: CallbackQuery, widget, dialog_manager: DialogManager, *args
+        ) -> None:
+            guard: IdempotencyGuard | None = dialog_manager.middleware_data.get(
+                "idempotency"
+            )
+            if guard is None:
+                await handler(callback, widget, dialog_manager, *args)
+                return
+
+            key = ":".join(
+                (
+                    str(callback.from_user.id),
+                    dialog_manager.current_context().id,
+                    widget.widget_id,
+                    payload(dialog_manager) if payload else "",
+                )
+            )
+            try:
+                claimed, outcome = await guard.claim(key, ttl)
+            except RedisError:
+                logger.exception(f"Could not claim '{key}', running the handler.")
+                await handler(callback, widget, dialog_manager, *args)
+                return
+
+            if not claimed:
+                logger.info(f"Repeated tap on '{key}' skipped.")
+                lang = dialog_manager.middleware_data.get("lang")
+                callback_answer = dialog_manager.middleware_data.get("callback_answer")
+                if callback_answer is None:
+                    return
+                if outcome is None:
+                    callback_answer.text = lexicon(lang, "repeat_in_progress")
+                elif outcome:
+                    callback_answer.text = outcome
+                return
+
+            try:
+                outcome = await handler(callback, widget, dialog_manager, *args)
+            except BaseException:
+                await guard.release(key)
+                raise
+            await guard.store(key, outcome or "")
+
+        return wrapper
+
+    return decorator
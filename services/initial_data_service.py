@@ -4,7 +4,15 @@ from loguru import logger
 from sqlalchemy import func, select
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
+from database.base import Base
 from database.models import Faculty, LastDay, TimetableSlot
+from database.schema import (
+    SCHEMA_VERSION,
+    lock_schema,
+    read_schema_version,
+    upgrade_schema,
+    write_schema_version,
+)
 
 # Data based on the provided photo and old logic
 FACULTIES_DATA = [
@@ -42,7 +50,9 @@ SHORT_DAY_SCHEDULE = [
 ]
 
 
-async def populate_initial_faculties(session_maker: async_sessionmaker[AsyncSession]):
+async def populate_initial_faculties(
+    session_maker: async_sessionmaker[AsyncSession], raise_errors: bool = False
+):
     """Populates the Faculty table with default data if it is empty."""
     async with session_maker() as session:
         try:
@@ -59,11 +69,15 @@ async def populate_initial_faculties(session_maker: async_sessionmaker[AsyncSess
             else:
                 logger.debug("Faculties table not empty. Skipping population.")
         except Exception:
+            if raise_errors:
+                raise
             logger.exception("Error while populating faculties.")
             await session.rollback()
 
 
-async def populate_initial_timetable(session_maker: async_sessionmaker[AsyncSession]):
+async def populate_initial_timetable(
+    session_maker: async_sessionmaker[AsyncSession], raise_errors: bool = False
+):
     """Populates the TimetableSlot table with a default weekly schedule."""
     async with session_maker() as session:
         try:
@@ -104,11 +118,15 @@ async def populate_initial_timetable(session_maker: async_sessionmaker[AsyncSess
             else:
                 logger.debug("TimetableSlots table not empty. Skipping population.")
         except Exception:
+            if raise_errors:
+                raise
             logger.exception("Error while populating timetable.")
             await session.rollback()
 
 
-async def populate_initial_lastday(session_maker: async_sessionmaker[AsyncSession]):
+async def populate_initial_lastday(
+    session_maker: async_sessionmaker[AsyncSession], raise_errors: bool = False
+):
     """Sets the initial last day for booking if not set."""
     async with session_maker() as session:
         try:
@@ -129,5 +147,46 @@ async def populate_initial_lastday(session_maker: async_sessionmaker[AsyncSessio
             else:
                 logger.debug(f"Last booking date already set to {last_day.last_date}.")
         except Exception:
+            if raise_errors:
+                raise
             logger.exception("Error while populating last day.")
             await session.rollback()
+
+
+async def bootstrap_database(session_maker: async_sessionmaker[AsyncSession]) -> bool:
+    """
+    Creates, upgrades and seeds the schema once per SCHEMA_VERSION.
+
+    Every replica reads the stored version in one query and, when it is
+    current, goes straight to serving. Otherwise the replica that gets the
+    advisory lock does the work in a single transaction and stores the new
+    version, and the replicas waiting on the lock find it done.
+
+    Returns:
+        True if this replica bootstrapped the database.
+    """
+    engine = session_maker.kw["bind"]
+    async with engine.connect() as conn:
+        version = await read_schema_version(conn)
+    if version >= SCHEMA_VERSION:
+        logger.info(f"Database schema is at version {version}.")
+        return False
+
+    async with engine.begin() as conn:
+        version = await lock_schema(conn)
+        if version >= SCHEMA_VERSION:
+            logger.info("Database schema was bootstrapped by another replica.")
+            return False
+
+        logger.info(f"Bootstrapping database schema {version} -> {SCHEMA_VERSION}...")
+        await conn.run_sync(Base.metadata.create_all)
+        await upgrade_schema(conn)
+        # Sessions joined to the lock transaction, committed with the version
+        seed_session_maker = async_sessionmaker(bind=conn, expire_on_commit=False)
+        # Errors propagate, a failed seed must fail the startup with its cause
+        await populate_initial_faculties(seed_session_maker, raise_errors=True)
+        await populate_initial_timetable(seed_session_maker, raise_errors=True)
+        await populate_initial_lastday(seed_session_maker, raise_errors=True)
+        await write_schema_version(conn, SCHEMA_VERSION)
+    logger.info(f"Database schema bootstrapped at version {SCHEMA_VERSION}.")
+    return True
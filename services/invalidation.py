@@ -0,0 +1,92 @@
+import asyncio
+import json
+import uuid
+from collections import defaultdict
+from typing import Callable
+
+from loguru import logger
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+CHANNEL = "das:invalidation"
+RECONNECT_DELAY = 5  # seconds
+
+
+class InvalidationBus:
+    """
+    Broadcasts invalidation topics for in-process caches to all bot replicas.
+
+    Handlers run locally right away and on every other replica via Redis
+    pub/sub. Without a Redis connection (e.g. in the scheduler) the bus
+    only notifies local handlers. A topic may carry JSON-serializable
+    arguments naming what changed; handlers called without arguments (e.g.
+    after a reconnect) must drop everything.
+    """
+
+    def __init__(self, channel: str = CHANNEL):
+        self.channel = channel
+        self.redis: Redis | None = None
+        self._origin = uuid.uuid4().hex
+        self._handlers: dict[str, list[Callable[..., None]]] = defaultdict(list)
+        self._listener: asyncio.Task | None = None
+
+    def subscribe(self, topic: str, handler: Callable[..., None]) -> None:
+        """Registers a synchronous handler for a topic."""
+        self._handlers[topic].append(handler)
+
+    async def publish(self, topic: str, *args) -> None:
+        """Notifies local handlers and all other replicas about a topic."""
+        self._notify(topic, *args)
+        if not self.redis:
+            return
+        message = json.dumps({"topic": topic, "args": args, "origin": self._origin})
+        try:
+            await self.redis.publish(self.channel, message)
+        except RedisError:
+            logger.exception(f"Failed to publish invalidation for '{topic}'.")
+
+    async def start(self, redis: Redis) -> None:
+        """Starts listening for invalidations from other replicas."""
+        self.redis = redis
+        self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        """Stops the listener task."""
+        if self._listener:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+    def _notify(self, topic: str, *args) -> None:
+        for handler in self._handlers.get(topic, []):
+            handler(*args)
+
+    def _notify_all(self) -> None:
+        for topic in list(self._handlers):
+            self._notify(topic)
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                async with self.redis.pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    # Messages may have been missed while disconnected
+                    self._notify_all()
+                    async for message in pubsub.listen():
+                        if message["type"] != "message":
+                            continue
+                        payload = json.loads(message["data"])
+                        if payload["origin"] != self._origin:
+                            logger.debug(f"Invalidation received: {payload['topic']}")
+                            self._notify(payload["topic"], *payload.get("args", ()))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Invalidation listener failed. Reconnecting...")
+                await asyncio.sleep(RECONNECT_DELAY)
+
+
+invalidation_bus = InvalidationBus()
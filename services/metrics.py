@@ -0,0 +1,219 @@
+import collections
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from prometheus_client import Counter, Gauge, Histogram
+from redis.asyncio.connection import Connection
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from .tracing import tracer
+
+NAMESPACE = "das_bot"
+
+UPDATES = Counter(
+    "updates_total",
+    "Updates received, by update type and outcome.",
+    ["type", "status"],
+    namespace=NAMESPACE,
+)
+UPDATE_SECONDS = Histogram(
+    "update_duration_seconds",
+    "Time spent processing an update, middlewares and handler included.",
+    ["type"],
+    namespace=NAMESPACE,
+)
+MIDDLEWARE_SECONDS = Histogram(
+    "middleware_duration_seconds",
+    "Time an update spent in middlewares and filters, outside its handler.",
+    ["type"],
+    namespace=NAMESPACE,
+)
+HANDLER_SECONDS = Histogram(
+    "handler_duration_seconds",
+    "Time spent in handlers, dialog handlers included.",
+    ["type"],
+    namespace=NAMESPACE,
+)
+UPDATE_QUEUE_PENDING = Gauge(
+    "update_queue_pending",
+    "Webhook updates queued or being processed.",
+    namespace=NAMESPACE,
+)
+UPDATE_QUEUE_SECONDS = Histogram(
+    "update_queue_wait_seconds",
+    "Time webhook updates waited in the queue for a worker.",
+    namespace=NAMESPACE,
+)
+UPDATES_DUPLICATE = Counter(
+    "updates_duplicate_total",
+    "Webhook updates skipped because they were already received.",
+    namespace=NAMESPACE,
+)
+UPDATES_REJECTED = Counter(
+    "updates_rejected_total",
+    "Webhook updates refused because the queue stayed full.",
+    namespace=NAMESPACE,
+)
+EVENT_LOCK_WAIT_SECONDS = Histogram(
+    "event_lock_wait_seconds",
+    "Time updates waited for the per-user event lock.",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+    namespace=NAMESPACE,
+)
+EVENT_LOCK_TIMEOUTS = Counter(
+    "event_lock_timeouts_total",
+    "Updates dropped because the event lock could not be taken in time.",
+    namespace=NAMESPACE,
+)
+EVENT_LOCK_LOST = Counter(
+    "event_lock_lost_total",
+    "Event locks that expired before their update finished.",
+    namespace=NAMESPACE,
+)
+DB_QUERIES = Counter(
+    "db_queries_total",
+    "SQL statements sent to the database.",
+    namespace=NAMESPACE,
+)
+DB_QUERY_SECONDS = Histogram(
+    "db_query_duration_seconds",
+    "Execution time of SQL statements.",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+    namespace=NAMESPACE,
+)
+DB_QUERIES_PER_UPDATE = Histogram(
+    "db_queries_per_update",
+    "SQL statements sent while processing one update.",
+    ["type"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55),
+    namespace=NAMESPACE,
+)
+REDIS_SECONDS = Histogram(
+    "redis_roundtrip_seconds",
+    "Round trip time of Redis commands and pipelines.",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+    namespace=NAMESPACE,
+)
+BOT_API_SECONDS = Histogram(
+    "bot_api_duration_seconds",
+    "Time spent in Telegram Bot API calls, by method.",
+    ["method"],
+    namespace=NAMESPACE,
+)
+BOT_API_ERRORS = Counter(
+    "bot_api_errors_total",
+    "Failed Telegram Bot API calls, by method and error.",
+    ["method", "error"],
+    namespace=NAMESPACE,
+)
+DEPENDENCY_UP = Gauge(
+    "dependency_up",
+    "Whether the last health check of a dependency passed.",
+    ["dependency"],
+    namespace=NAMESPACE,
+)
+DEPENDENCY_LATENCY_SECONDS = Histogram(
+    "dependency_check_duration_seconds",
+    "Duration of dependency health checks.",
+    ["dependency"],
+    namespace=NAMESPACE,
+)
+BOOKINGS = Counter(
+    "bookings_total",
+    "Booking attempts, by result (created, rescheduled, too_late).",
+    ["result"],
+    namespace=NAMESPACE,
+)
+CANCELLATIONS = Counter(
+    "cancellations_total",
+    "Cancellation attempts, by result (cancelled, no_booking).",
+    ["result"],
+    namespace=NAMESPACE,
+)
+
+
+@dataclass
+class UpdateStats:
+    """Counters of the update being processed, shared by its middlewares."""
+
+    queries: int = 0
+    db_seconds: float = 0.0
+    handler_seconds: float | None = None
+    # Run count and total time of each distinct SQL text
+    statements: collections.Counter = field(default_factory=collections.Counter)
+    statement_seconds: collections.Counter = field(default_factory=collections.Counter)
+
+
+current_update_stats: ContextVar[UpdateStats | None] = ContextVar(
+    "current_update_stats", default=None
+)
+
+
+def _before_cursor_execute(
+    conn, cursor, statement, parameters, context, executemany
+) -> None:
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(
+    conn, cursor, statement, parameters, context, executemany
+) -> None:
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    DB_QUERIES.inc()
+    DB_QUERY_SECONDS.observe(elapsed)
+    stats = current_update_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += elapsed
+        stats.statements[statement] += 1
+        stats.statement_seconds[statement] += elapsed
+    if tracer.enabled:
+        tracer.record("sql", elapsed, statement=" ".join(statement.split())[:500])
+
+
+def _handle_error(exception_context) -> None:
+    # Failed statements never reach after_cursor_execute
+    conn = exception_context.connection
+    if conn is not None and conn.info.get("query_started"):
+        conn.info["query_started"].pop()
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    """Counts and times every statement of an engine, per update and in total."""
+    sync_engine = engine.sync_engine
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
+
+
+class InstrumentedConnection(Connection):
+    """
+    A Redis connection that records the round trip of each command.
+
+    Only the first reply after a send is timed, so a pipeline counts as one
+    round trip and pub/sub messages nobody asked for are not counted.
+    """
+
+    _sent_at: float | None = None
+    _command: str | None = None
+
+    async def send_command(self, *args, **kwargs) -> None:
+        self._command = str(args[0])
+        await super().send_command(*args, **kwargs)
+
+    async def send_packed_command(self, command, check_health: bool = True) -> None:
+        self._sent_at = time.perf_counter()
+        await super().send_packed_command(command, check_health)
+
+    async def read_response(self, *args, **kwargs):
+        try:
+            return await super().read_response(*args, **kwargs)
+        finally:
+            if self._sent_at is not None:
+                elapsed = time.perf_counter() - self._sent_at
+                REDIS_SECONDS.observe(elapsed)
+                if tracer.enabled:
+                    tracer.record(f"redis {self._command or 'pipeline'}", elapsed)
+                self._sent_at = self._command = None
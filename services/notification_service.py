@@ -11,6 +11,14 @@ from sqlalchemy.orm import selectinload
 from database.models import Booking
 from lexicon import lexicon
 
+from .schedule_service import SLOT_MINUTES, slot_position
+
+
+def _upcoming_slot(moment: datetime.datetime) -> tuple[datetime.date, int]:
+    """Returns the date and index of the first slot starting at or after a moment."""
+    moment = moment.replace(second=0, microsecond=0)
+    return slot_position(moment + datetime.timedelta(minutes=SLOT_MINUTES - 1))
+
 
 async def send_notifications(bot: Bot, session_maker: async_sessionmaker[AsyncSession]):
     """
@@ -21,12 +29,13 @@ async def send_notifications(bot: Bot, session_maker: async_sessionmaker[AsyncSe
     now_moscow = datetime.datetime.now(moscow_tz)
     logger.debug(f"Running notification job at {now_moscow.isoformat()}")
 
-    # Convert current time to UTC to query the database correctly
-    now_utc = now_moscow.astimezone(ZoneInfo("UTC"))
-
-    # Define time windows in UTC for correct DB querying
-    day_ahead_utc = now_utc + datetime.timedelta(days=1)
-    hour_ahead_utc = now_utc + datetime.timedelta(hours=1)
+    # The first slots starting within the next 5 minutes, a day and an hour ahead
+    day_ahead_date, day_ahead_slot = _upcoming_slot(
+        now_moscow + datetime.timedelta(days=1)
+    )
+    hour_ahead_date, hour_ahead_slot = _upcoming_slot(
+        now_moscow + datetime.timedelta(hours=1)
+    )
 
     notification_photo = FSInputFile("assets/map.jpg")
 
@@ -35,12 +44,8 @@ async def send_notifications(bot: Bot, session_maker: async_sessionmaker[AsyncSe
         stmt_day = (
             select(Booking)
             .where(
-                Booking.booking_datetime
-                >= day_ahead_utc.replace(second=0, microsecond=0),
-                Booking.booking_datetime
-                < (day_ahead_utc + datetime.timedelta(minutes=5)).replace(
-                    second=0, microsecond=0
-                ),
+                Booking.booking_date == day_ahead_date,
+                Booking.slot_index == day_ahead_slot,
             )
             .options(selectinload(Booking.user))
         )
@@ -71,12 +76,8 @@ async def send_notifications(bot: Bot, session_maker: async_sessionmaker[AsyncSe
         stmt_hour = (
             select(Booking)
             .where(
-                Booking.booking_datetime
-                >= hour_ahead_utc.replace(second=0, microsecond=0),
-                Booking.booking_datetime
-                < (hour_ahead_utc + datetime.timedelta(minutes=5)).replace(
-                    second=0, microsecond=0
-                ),
+                Booking.booking_date == hour_ahead_date,
+                Booking.slot_index == hour_ahead_slot,
             )
             .options(selectinload(Booking.user))
         )
@@ -0,0 +1,21 @@
+from redis.asyncio import Redis
+
+PIN_SECONDS = 5  # Comfortably above the expected replication lag
+KEY_PREFIX = "ryw"
+
+
+class ReadYourWritesGuard:
+    """
+    Remembers users whose update just wrote to the primary, so their next
+    updates keep reading from the primary until the replica has caught up.
+    """
+
+    def __init__(self, redis: Redis, pin_seconds: int = PIN_SECONDS):
+        self.redis = redis
+        self.pin_seconds = pin_seconds
+
+    async def mark_writer(self, user_id: int) -> None:
+        await self.redis.set(f"{KEY_PREFIX}:{user_id}", 1, ex=self.pin_seconds)
+
+    async def is_recent_writer(self, user_id: int) -> bool:
+        return bool(await self.redis.exists(f"{KEY_PREFIX}:{user_id}"))
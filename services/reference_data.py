@@ -0,0 +1,148 @@
+import asyncio
+import datetime
+from dataclasses import dataclass
+
+from loguru import logger
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import Faculty, LastDay, TimetableSlot
+
+from .invalidation import invalidation_bus
+
+REFERENCE_DATA_TOPIC = "reference_data"
+
+
+@dataclass(frozen=True)
+class FacultyRecord:
+    """An immutable snapshot of a Faculty."""
+
+    faculty_id: int
+    name: str
+    window_number: int
+
+
+@dataclass(frozen=True)
+class TimetableBlock:
+    """An immutable snapshot of a TimetableSlot."""
+
+    slot_id: int
+    day_of_week: int
+    start_time: datetime.time
+    end_time: datetime.time
+    is_active: bool
+    window_number: int
+
+
+@dataclass(frozen=True)
+class ReferenceData:
+    """One consistent version of the small, rarely changing tables."""
+
+    version: int
+    last_day: datetime.date | None
+    # Ordered by name, as shown in the registration dialog
+    faculties: tuple[FacultyRecord, ...]
+    timetable: tuple[TimetableBlock, ...]
+
+    def faculty(self, faculty_id: int | None) -> FacultyRecord | None:
+        return next(
+            (faculty for faculty in self.faculties if faculty.faculty_id == faculty_id),
+            None,
+        )
+
+    def active_slots(
+        self, window: int, day_of_week: int | None = None
+    ) -> list[TimetableBlock]:
+        """Returns the active timetable blocks of a window, optionally for a weekday."""
+        return [
+            block
+            for block in self.timetable
+            if block.is_active
+            and block.window_number == window
+            and (day_of_week is None or block.day_of_week == day_of_week)
+        ]
+
+    def distinct_times(self) -> list[tuple[datetime.time, datetime.time]]:
+        """Returns the distinct (start, end) pairs of all blocks, by start time."""
+        return sorted({(block.start_time, block.end_time) for block in self.timetable})
+
+
+class ReferenceDataCache:
+    """
+    Process-wide cache of LastDay, faculties and the timetable.
+
+    The three tables are loaded together into an immutable, versioned
+    snapshot, so a single interaction never mixes data from two versions.
+    The snapshot is reloaded lazily after `invalidate()`, which every
+    replica receives through the invalidation bus.
+    """
+
+    def __init__(self):
+        self._data: ReferenceData | None = None
+        self._generation = 0
+        self._loaded_generation = -1
+        self._lock = asyncio.Lock()
+
+    @property
+    def is_stale(self) -> bool:
+        return self._loaded_generation != self._generation
+
+    def invalidate(self) -> None:
+        """Marks the snapshot for a reload on next use."""
+        self._generation += 1
+
+    async def get(self, session: AsyncSession) -> ReferenceData:
+        """Returns the current snapshot, reloading it from the database if stale."""
+        if not self.is_stale:
+            return self._data
+        async with self._lock:
+            if not self.is_stale:
+                return self._data
+            generation = self._generation
+            # Read from the primary, a lagging replica would pin a stale version
+            last_day = await session.scalar(
+                select(LastDay)
+                .where(LastDay.id == 1)
+                .execution_options(use_primary=True)
+            )
+            faculties = (
+                await session.scalars(
+                    select(Faculty)
+                    .order_by(Faculty.name)
+                    .execution_options(use_primary=True)
+                )
+            ).all()
+            timetable = (
+                await session.scalars(
+                    select(TimetableSlot)
+                    .order_by(TimetableSlot.slot_id)
+                    .execution_options(use_primary=True)
+                )
+            ).all()
+            self._data = ReferenceData(
+                version=generation,
+                last_day=last_day.last_date if last_day else None,
+                faculties=tuple(
+                    FacultyRecord(f.faculty_id, f.name, f.window_number)
+                    for f in faculties
+                ),
+                timetable=tuple(
+                    TimetableBlock(
+                        s.slot_id,
+                        s.day_of_week,
+                        s.start_time,
+                        s.end_time,
+                        s.is_active,
+                        s.window_number,
+                    )
+                    for s in timetable
+                ),
+            )
+            # An invalidation during the load leaves the snapshot stale
+            self._loaded_generation = generation
+            logger.debug(f"Reference data loaded (version {generation}).")
+            return self._data
+
+
+reference_data = ReferenceDataCache()
+invalidation_bus.subscribe(REFERENCE_DATA_TOPIC, reference_data.invalidate)
@@ -25,7 +25,7 @@ async def generate_excel_report(session: AsyncSession, lang: str) -> str | None:
     stmt = (
         select(Booking)
         .options(selectinload(Booking.user).selectinload(User.faculty))
-        .order_by(Booking.booking_datetime)
+        .order_by(Booking.booking_date, Booking.slot_index, Booking.window_number)
     )
     result = await session.scalars(stmt)
     all_bookings = result.all()
@@ -36,10 +36,10 @@ async def generate_excel_report(session: AsyncSession, lang: str) -> str | None:
     today = datetime.date.today()
     filename = f"booking_report_{today.isoformat()}.xlsx"
 
-    # Group bookings by date using a more robust method
+    # Group bookings by their local date
     bookings_by_date = defaultdict(list)
     for booking in all_bookings:
-        bookings_by_date[booking.booking_datetime.date()].append(booking)
+        bookings_by_date[booking.booking_date].append(booking)
 
     with pd.ExcelWriter(filename, engine="openpyxl") as writer:
         # Sort dates to ensure sheets are in chronological order
@@ -47,14 +47,9 @@ async def generate_excel_report(session: AsyncSession, lang: str) -> str | None:
             bookings_on_day = bookings_by_date[date]
             sheet_name = date.strftime("%d-%m-%Y")
 
-            # Sort bookings within the day by time and window
-            sorted_bookings = sorted(
-                bookings_on_day,
-                key=lambda b: (b.booking_datetime.time(), b.window_number),
-            )
-
             report_data = []
-            for booking in sorted_bookings:
+            # Already sorted by time and window by the query
+            for booking in bookings_on_day:
                 user = booking.user
                 if not user:  # Skip if the user was deleted
                     continue
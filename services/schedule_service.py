@@ -1,17 +1,45 @@
+import dataclasses
 import datetime
-from typing import Dict, List, Tuple
+from collections import defaultdict
+from typing import Dict, Iterable, List, Sequence, Tuple
 from zoneinfo import ZoneInfo
 
 from loguru import logger
-from sqlalchemy import desc, func, or_, select
+from sqlalchemy import delete, select, tuple_, update
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from database.models import Booking, LastDay, ScheduleException, TimetableSlot, User
+from database.models import Booking, User
 
+from .availability_cache import AvailabilityCache
+from .exception_index import ExceptionRule, exception_index
+from .metrics import BOOKINGS, CANCELLATIONS
+from .reference_data import TimetableBlock, reference_data
+from .slot_holds import SlotHolds
+from .tracing import traced
+from .user_profiles import UserProfile, UserProfileCache
 
-async def get_user_booking(session: AsyncSession, user: User) -> Booking | None:
-    """Retrieves the current booking for a given user."""
-    return await session.scalar(select(Booking).where(Booking.user_id == user.user_id))
+SLOT_MINUTES = 5
+
+
+def slot_position(moment: datetime.datetime) -> Tuple[datetime.date, int]:
+    """
+    Returns the local (Moscow) date and slot index of a moment.
+    Naive datetimes are assumed to already be in Moscow time.
+    """
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(ZoneInfo("Europe/Moscow"))
+    return moment.date(), (moment.hour * 60 + moment.minute) // SLOT_MINUTES
+
+
+@traced()
+async def get_user_booking(session: AsyncSession, user: UserProfile) -> Booking | None:
+    """Retrieves the current booking for a given user from the primary."""
+    return await session.scalar(
+        select(Booking)
+        .where(Booking.user_id == user.user_id)
+        .execution_options(use_primary=True)
+    )
 
 
 def _generate_staggered_slots(
@@ -42,69 +70,122 @@ def _generate_staggered_slots(
     return generated_slots
 
 
+@traced()
 async def get_available_slots(
-    session: AsyncSession, user: User, target_date: datetime.date
+    session: AsyncSession,
+    user: UserProfile | None,
+    target_date: datetime.date,
+    cache: AvailabilityCache | None = None,
+    holds: SlotHolds | None = None,
 ) -> List[datetime.datetime]:
     """
     Generates available slots using a unified exception-based system.
+    If a cache is given, the computed slots are shared through it.
+    If holds are given, slots held by other users are hidden.
+    Unregistered users get no slots.
     """
-    # --- Validation Layer ---
-    last_day_record = await session.get(LastDay, 1)
-    if not last_day_record or target_date > last_day_record.last_date:
+    if user is None:
         return []
-    if not user.faculty:
+    if not user.window:
         logger.error(f"User {user.telegram_id} has no faculty.")
         return []
+    window = user.window
 
-    # 1. Fetch all active exceptions for the date, ordered by priority.
-    day_of_week = target_date.weekday()
-    stmt_exceptions = (
-        select(ScheduleException)
-        .where(
-            ScheduleException.start_date <= target_date,
-            or_(
-                ScheduleException.end_date == None,  # noqa
-                ScheduleException.end_date >= target_date,
-            ),
-            ScheduleException.is_active == True,
+    available_slots = None
+    if cache:
+        cached_slots = await cache.get(target_date, window, user.year)
+        if cached_slots is not None:
+            now_moscow = datetime.datetime.now(ZoneInfo("Europe/Moscow"))
+            now_naive = now_moscow.replace(tzinfo=None)
+            available_slots = [slot for slot in cached_slots if slot > now_naive]
+
+    if available_slots is None:
+        # Read before the computation, so a change made meanwhile is detected
+        version = await cache.version(target_date) if cache else None
+        available_slots = await _compute_available_slots(session, user, target_date)
+        if cache:
+            await cache.store(target_date, window, user.year, available_slots, version)
+
+    if holds:
+        held_slots = await holds.held_by_others(target_date, window, user.user_id)
+        available_slots = [
+            slot for slot in available_slots if slot_position(slot)[1] not in held_slots
+        ]
+    return available_slots
+
+
+async def _compute_available_slots(
+    session: AsyncSession, user: UserProfile, target_date: datetime.date
+) -> List[datetime.datetime]:
+    """Computes available slots for a date, bypassing the availability cache."""
+    # --- Validation Layer ---
+    ref = await reference_data.get(session)
+    if not ref.last_day or target_date > ref.last_day:
+        return []
+
+    # 1. Look up the exceptions for the date in the in-process rule index.
+    await exception_index.ensure_loaded(session)
+    day_rules = exception_index.rules_for(target_date, user.year)
+
+    # 2. Check 'exclusive' year-based rules and 'non-working' rules.
+    if day_rules.is_blocked:
+        logger.debug(
+            f"Date {target_date} is blocked for user {user.telegram_id} by an exception."
         )
-        .order_by(desc(ScheduleException.priority))
-    )
-    exceptions = (await session.scalars(stmt_exceptions)).all()
-
-    # 2. Preliminary check for 'exclusive' year-based rules.
-    for exc in exceptions:
-        if exc.block_others_if_years_mismatch and exc.allowed_years:
-            if user.year not in exc.allowed_years:
-                logger.debug(
-                    f"User {user.telegram_id} blocked by exclusive year rule ID {exc.exception_id}"
-                )
-                return []
-
-    # 3. Check for a 'non-working' rule.
-    if any(e.is_non_working for e in exceptions):
-        logger.debug(f"Date {target_date} is a non-working day due to an exception.")
         return []
 
-    # 4. Get the base schedule and prepare for modifications.
-    stmt_slots = select(TimetableSlot).where(
-        TimetableSlot.day_of_week == day_of_week,
-        TimetableSlot.is_active == True,
-        TimetableSlot.window_number == user.faculty.window_number,
+    # 3. Get the base schedule and apply 'modification' exceptions.
+    base_slots = ref.active_slots(user.window, target_date.weekday())
+    resolved = _resolve_time_blocks(day_rules.modifiers, base_slots, target_date)
+    if not resolved:
+        return []
+    time_blocks, start_window = resolved
+
+    # 4. Generate and filter slots.
+    potential_slots = _generate_staggered_slots(
+        target_date=target_date,
+        time_blocks=time_blocks,
+        start_window=start_window,
+        user_window=user.window,
     )
-    base_slots = await session.scalars(stmt_slots)
 
+    # Free slots are shared through the cache, so they are read from the primary
+    stmt_bookings = (
+        select(Booking.slot_index)
+        .where(
+            Booking.booking_date == target_date,
+            Booking.window_number == user.window,
+        )
+        .execution_options(use_primary=True)
+    )
+    booked_slots = set((await session.scalars(stmt_bookings)).all())
+    available_slots = [
+        slot for slot in potential_slots if slot_position(slot)[1] not in booked_slots
+    ]
+
+    # Return naive datetime objects to the dialog for simplicity
+    return sorted([slot.replace(tzinfo=None) for slot in available_slots])
+
+
+def _resolve_time_blocks(
+    modifiers: Sequence[ExceptionRule],
+    base_slots: Iterable[TimetableBlock],
+    target_date: datetime.date,
+) -> Tuple[List[Dict[str, datetime.time]], int] | None:
+    """
+    Applies 'modification' exceptions to the base schedule of a date.
+    `modifiers` must already be filtered for the date and the user's year.
+    Returns the time blocks and the start window, or None if there are no blocks.
+    """
+    day_of_week = target_date.weekday()
     time_blocks: List[Dict[str, datetime.time]] = [
-        {"start": slot.start_time, "end": slot.end_time} for slot in base_slots
+        {"start": slot.start_time, "end": slot.end_time}
+        for slot in base_slots
+        if slot.day_of_week == day_of_week
     ]
     start_window = 1
 
-    # Apply 'modification' exceptions relevant for this user.
-    for exc in exceptions:
-        if exc.allowed_years and user.year not in exc.allowed_years:
-            continue
-        if exc.target_days_of_week and day_of_week not in exc.target_days_of_week:
-            continue
+    for exc in modifiers:
         if exc.start_window_override is not None:
             start_window = exc.start_window_override
         if exc.target_start_time and exc.new_start_time and exc.new_end_time:
@@ -115,73 +196,161 @@ async def get_available_slots(
                     break
 
     if not time_blocks:
-        return []
+        return None
+    return time_blocks, start_window
 
-    # 5. Generate and filter slots.
-    potential_slots = _generate_staggered_slots(
-        target_date=target_date,
-        time_blocks=time_blocks,
-        start_window=start_window,
-        user_window=user.faculty.window_number,
-    )
 
-    stmt_bookings = select(Booking.booking_datetime).where(
-        func.date(Booking.booking_datetime) == target_date,
-        Booking.window_number == user.faculty.window_number,
+@traced()
+async def get_days_availability(
+    session: AsyncSession,
+    user: UserProfile | None,
+    start_date: datetime.date,
+    end_date: datetime.date,
+) -> Dict[datetime.date, int]:
+    """
+    Counts free slots for every date in a range, e.g. a visible calendar month.
+
+    Uses the exception index, the cached timetable and one bookings query
+    for the whole range instead of a full evaluation per date. Only
+    bookings on slots of the current grid count against it.
+    """
+    if user is None or not user.window or start_date > end_date:
+        return {}
+    window = user.window
+    moscow_tz = ZoneInfo("Europe/Moscow")
+
+    await exception_index.ensure_loaded(session)
+    base_slots = (await reference_data.get(session)).active_slots(window)
+
+    stmt_bookings = select(Booking.booking_date, Booking.slot_index).where(
+        Booking.booking_date.between(start_date, end_date),
+        Booking.window_number == window,
+        # Only bookings still ahead count against the future slots
+        tuple_(Booking.booking_date, Booking.slot_index)
+        > slot_position(datetime.datetime.now(moscow_tz)),
     )
-    booked_times = set((await session.scalars(stmt_bookings)).all())
-    available_slots = [slot for slot in potential_slots if slot not in booked_times]
+    booked_slots = defaultdict(set)
+    for booking_date, slot_index in await session.execute(stmt_bookings):
+        booked_slots[booking_date].add(slot_index)
 
-    # Return naive datetime objects to the dialog for simplicity
-    return sorted([slot.replace(tzinfo=None) for slot in available_slots])
+    availability = {}
+    current_date = start_date
+    while current_date <= end_date:
+        day_rules = exception_index.rules_for(current_date, user.year)
+        resolved = None
+        if not day_rules.is_blocked:
+            resolved = _resolve_time_blocks(
+                day_rules.modifiers, base_slots, current_date
+            )
+        free_slots = 0
+        if resolved:
+            time_blocks, start_window = resolved
+            potential_slots = _generate_staggered_slots(
+                target_date=current_date,
+                time_blocks=time_blocks,
+                start_window=start_window,
+                user_window=window,
+            )
+            booked = booked_slots.get(current_date, set())
+            free_slots = sum(
+                1 for slot in potential_slots if slot_position(slot)[1] not in booked
+            )
+        availability[current_date] = free_slots
+        current_date += datetime.timedelta(days=1)
+    return availability
 
 
+@traced()
 async def create_booking(
-    session: AsyncSession, user: User, booking_datetime: datetime.datetime
+    session: AsyncSession,
+    user: UserProfile,
+    booking_datetime: datetime.datetime,
+    cache: AvailabilityCache | None = None,
+    profiles: UserProfileCache | None = None,
 ) -> Tuple[Booking | None, str | None, bool]:
     """
     Creates or updates a booking for a user.
     `booking_datetime` is expected to be a naive datetime from the dialog.
+
+    The slot is claimed with a single INSERT ... ON CONFLICT DO NOTHING, so a
+    concurrent claim of the same slot ends in "too_late" instead of an
+    IntegrityError. Any existing booking is swapped for the new one inside
+    a savepoint, so a failed claim keeps it. Whether this is a reschedule is
+    decided by that delete, not by the possibly stale profile.
+    If a profile cache is given, the updated profile is written through.
     """
-    is_reschedule = False
+    booking_date, slot_index = slot_position(booking_datetime)
     # The AwareDateTime type will handle conversion to UTC before saving
-    if user.is_signed_up:
-        is_reschedule = True
-        old_booking = await get_user_booking(session, user)
-        if old_booking:
-            logger.info(
-                f"User {user.telegram_id} is rescheduling. Deleting old booking {old_booking.booking_id}."
-            )
-            await session.delete(old_booking)
-            await session.flush()
-        else:
-            logger.warning(
-                f"User {user.telegram_id} has is_signed_up=True but no booking found."
-            )
-
-    # Re-verify the slot is free. AwareDateTime type handles timezone on booking_datetime.
-    stmt = select(Booking).where(
-        Booking.booking_datetime == booking_datetime,
-        Booking.window_number == user.faculty.window_number,
+    claim_stmt = (
+        insert(Booking)
+        .values(
+            user_id=user.user_id,
+            booking_datetime=booking_datetime,
+            window_number=user.window,
+            booking_date=booking_date,
+            slot_index=slot_index,
+        )
+        .on_conflict_do_nothing()
+        .returning(Booking)
     )
-    if await session.scalar(stmt):
+    delete_stmt = (
+        delete(Booking)
+        .where(Booking.user_id == user.user_id)
+        .returning(Booking.booking_id, Booking.booking_date, Booking.window_number)
+        .execution_options(synchronize_session=False)
+    )
+
+    savepoint = await session.begin_nested()
+    old_booking_slot = (await session.execute(delete_stmt)).first()
+    is_reschedule = old_booking_slot is not None
+    if is_reschedule:
+        logger.info(
+            f"User {user.telegram_id} is rescheduling. Deleting old booking {old_booking_slot.booking_id}."
+        )
+    new_booking = await session.scalar(claim_stmt)
+    if new_booking is None:
+        # Restores the old booking without expiring the loaded objects
+        await savepoint.rollback()
+        BOOKINGS.labels("too_late").inc()
         return None, "too_late", is_reschedule
+    await savepoint.commit()
 
-    new_booking = Booking(
-        user_id=user.user_id,
-        booking_datetime=booking_datetime,
-        window_number=user.faculty.window_number,
+    await session.execute(
+        update(User).where(User.user_id == user.user_id).values(is_signed_up=True)
     )
-    user.is_signed_up = True
-    session.add(new_booking)
     await session.commit()
+    BOOKINGS.labels("rescheduled" if is_reschedule else "created").inc()
+
+    if profiles:
+        await profiles.store(
+            dataclasses.replace(
+                user,
+                is_signed_up=True,
+                booking_datetime=new_booking.booking_datetime,
+                booking_window=new_booking.window_number,
+            )
+        )
+
+    if cache:
+        await cache.discard_slot(booking_datetime, new_booking.window_number)
+        if old_booking_slot:
+            await cache.invalidate_date(
+                old_booking_slot.booking_date, old_booking_slot.window_number
+            )
     return new_booking, None, is_reschedule
 
 
-async def cancel_booking(session: AsyncSession, user: User) -> Tuple[bool, str | None]:
+@traced()
+async def cancel_booking(
+    session: AsyncSession,
+    user: UserProfile,
+    cache: AvailabilityCache | None = None,
+    profiles: UserProfileCache | None = None,
+) -> Tuple[bool, str | None]:
     """Cancels a user's booking."""
     booking = await get_user_booking(session, user)
     if not booking:
+        CANCELLATIONS.labels("no_booking").inc()
         return False, "no_booking"
 
     # Check 3-hour rule. booking.booking_datetime is already in Moscow Time.
@@ -192,7 +361,20 @@ async def cancel_booking(session: AsyncSession, user: User) -> Tuple[bool, str |
     # if datetime.timedelta(0) < time_diff < datetime.timedelta(hours=3):
     #     return False, "too_late"
 
-    user.is_signed_up = False
+    await session.execute(
+        update(User).where(User.user_id == user.user_id).values(is_signed_up=False)
+    )
     await session.delete(booking)
     await session.commit()
+    CANCELLATIONS.labels("cancelled").inc()
+
+    if profiles:
+        await profiles.store(
+            dataclasses.replace(
+                user, is_signed_up=False, booking_datetime=None, booking_window=None
+            )
+        )
+
+    if cache:
+        await cache.invalidate_date(booking.booking_date, booking.window_number)
     return True, None
@@ -0,0 +1,99 @@
+import datetime
+import time
+
+from redis.asyncio import Redis
+
+HOLD_TTL = 60  # seconds
+KEY_PREFIX = "hold"
+
+# KEYS: hold key, per-date index; ARGV: owner, ttl, index member, expiry, now
+ACQUIRE_SCRIPT = """
+local holder = redis.call('GET', KEYS[1])
+if holder and holder ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', ARGV[5])
+redis.call('ZADD', KEYS[2], ARGV[4], ARGV[3])
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+return 1
+"""
+
+# KEYS: hold key, per-date index; ARGV: owner, index member
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('DEL', KEYS[1])
+end
+redis.call('ZREM', KEYS[2], ARGV[2])
+return 1
+"""
+
+
+class SlotHolds:
+    """
+    Short-lived Redis holds on slots while a student is on the confirm screen.
+
+    A hold is a per-slot key set atomically with a TTL, plus a member in a
+    per-(date, window) sorted set scored by expiry, so the slots held by
+    others on a date can be read in one round trip.
+    """
+
+    def __init__(self, redis: Redis, ttl: int = HOLD_TTL):
+        self.redis = redis
+        self.ttl = ttl
+        self._acquire = redis.register_script(ACQUIRE_SCRIPT)
+        self._release = redis.register_script(RELEASE_SCRIPT)
+
+    @staticmethod
+    def _index_key(target_date: datetime.date, window: int) -> str:
+        return f"{KEY_PREFIX}s:{target_date.isoformat()}:{window}"
+
+    def _keys(
+        self, target_date: datetime.date, window: int, slot_index: int
+    ) -> list[str]:
+        return [
+            f"{KEY_PREFIX}:{target_date.isoformat()}:{window}:{slot_index}",
+            self._index_key(target_date, window),
+        ]
+
+    async def acquire(
+        self,
+        target_date: datetime.date,
+        window: int,
+        slot_index: int,
+        owner: int,
+    ) -> bool:
+        """Holds a slot for the owner. Returns False if someone else holds it."""
+        now = time.time()
+        acquired = await self._acquire(
+            keys=self._keys(target_date, window, slot_index),
+            args=[owner, self.ttl, f"{slot_index}:{owner}", now + self.ttl, now],
+        )
+        return bool(acquired)
+
+    async def release(
+        self,
+        target_date: datetime.date,
+        window: int,
+        slot_index: int,
+        owner: int,
+    ) -> None:
+        """Releases the owner's hold on a slot, if it still has one."""
+        await self._release(
+            keys=self._keys(target_date, window, slot_index),
+            args=[owner, f"{slot_index}:{owner}"],
+        )
+
+    async def held_by_others(
+        self, target_date: datetime.date, window: int, owner: int
+    ) -> set[int]:
+        """Returns the slot indexes on a date currently held by other users."""
+        members = await self.redis.zrangebyscore(
+            self._index_key(target_date, window), time.time(), "+inf"
+        )
+        held = set()
+        for member in members:
+            slot_index, holder = member.decode().split(":")
+            if int(holder) != owner:
+                held.add(int(slot_index))
+        return held
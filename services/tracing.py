@@ -0,0 +1,280 @@
+import asyncio
+import functools
+import json
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Callable, Iterator
+
+from loguru import logger
+
+if TYPE_CHECKING:
+    # config_data loads the .env on import, which the benchmarks do without
+    from config_data.config import TracingConfig
+
+SERVICE_NAME = "das-payment-bot"
+# Spans kept per trace, so a runaway loop cannot exhaust memory
+MAX_SPANS = 1000
+# Traces waiting for the writer thread; more are dropped rather than queued
+MAX_QUEUED = 1000
+
+# OTLP status codes and span kinds
+STATUS_ERROR = 2
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+KIND_CLIENT = 3
+
+
+@dataclass
+class _Trace:
+    trace_id: str
+    sampled: bool
+    spans: list["Span"] = field(default_factory=list)
+    open: int = 0
+    exported: bool = False
+
+
+@dataclass
+class Span:
+    """A timed operation within a trace."""
+
+    trace: _Trace
+    span_id: str
+    parent_id: str | None
+    name: str
+    kind: int
+    start_ns: int
+    end_ns: int = 0
+    attributes: dict[str, Any] = field(default_factory=dict)
+    error: str | None = None
+
+
+_current_span: ContextVar[Span | None] = ContextVar("current_span", default=None)
+
+
+def _attribute_value(value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class Tracer:
+    """
+    Records nested spans per update and writes sampled traces to a file.
+
+    Each line of the file is one trace in the OTLP/JSON format, readable by
+    the OpenTelemetry Collector's otlpjsonfile receiver. A share of traces is
+    sampled up front, and any trace slower than the slow threshold is kept
+    as well, so slow requests can always be reconstructed. Until
+    `configure()` is called with a path, spans cost a single attribute check.
+    Traces are encoded and written by a background thread, so the event
+    loop never waits on file I/O.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.sample_rate = 0.0
+        self.slow_ns = 0
+        self._file = None
+        self._resource: dict = {}
+        self._queue: queue.Queue[_Trace | None] = queue.Queue(MAX_QUEUED)
+        self._writer: threading.Thread | None = None
+
+    def configure(self, config: "TracingConfig") -> None:
+        """Starts recording spans if the config names an output file."""
+        if not config.path:
+            return
+        self._file = open(config.path, "a", encoding="utf-8")
+        self.sample_rate = config.sample_rate
+        self.slow_ns = config.slow_ms * 1_000_000
+        self._resource = {
+            "attributes": [
+                {"key": "service.name", "value": _attribute_value(SERVICE_NAME)},
+                {
+                    "key": "host.name",
+                    "value": _attribute_value(os.environ.get("HOSTNAME", "")),
+                },
+            ]
+        }
+        self._writer = threading.Thread(
+            target=self._write, name="trace-writer", daemon=True
+        )
+        self._writer.start()
+        self.enabled = True
+        logger.info(
+            f"Tracing to {config.path} (sample rate {config.sample_rate}, "
+            f"slow traces over {config.slow_ms} ms)."
+        )
+
+    def close(self) -> None:
+        """Stops recording, writes the queued traces and closes the file."""
+        self.enabled = False
+        if self._writer:
+            self._queue.put(None)
+            self._writer.join()
+            self._writer = None
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    @contextmanager
+    def span(
+        self, name: str, kind: int = KIND_INTERNAL, **attributes: Any
+    ) -> Iterator[Span | None]:
+        """Records the enclosed block as a child of the current span."""
+        if not self.enabled:
+            yield None
+            return
+        parent = _current_span.get()
+        if parent is None or parent.trace.exported:
+            trace = _Trace(
+                trace_id=os.urandom(16).hex(),
+                sampled=random.random() < self.sample_rate,
+            )
+            parent = None
+        else:
+            trace = parent.trace
+        span = Span(
+            trace=trace,
+            span_id=os.urandom(8).hex(),
+            parent_id=parent.span_id if parent else None,
+            name=name,
+            kind=kind,
+            start_ns=time.time_ns(),
+            attributes=attributes,
+        )
+        trace.open += 1
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{e.__class__.__name__}: {e}"
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end_ns = time.time_ns()
+            self._end(span)
+
+    def record(self, name: str, seconds: float, **attributes: Any) -> None:
+        """Adds a child span that has just ended after `seconds`."""
+        if not self.enabled:
+            return
+        parent = _current_span.get()
+        if parent is None or parent.trace.exported:
+            return
+        end_ns = time.time_ns()
+        span = Span(
+            trace=parent.trace,
+            span_id=os.urandom(8).hex(),
+            parent_id=parent.span_id,
+            name=name,
+            kind=KIND_CLIENT,
+            start_ns=end_ns - int(seconds * 1_000_000_000),
+            end_ns=end_ns,
+            attributes=attributes,
+        )
+        if len(parent.trace.spans) < MAX_SPANS:
+            parent.trace.spans.append(span)
+
+    def _end(self, span: Span) -> None:
+        trace = span.trace
+        if len(trace.spans) < MAX_SPANS:
+            trace.spans.append(span)
+        trace.open -= 1
+        if trace.open:
+            return
+        try:
+            # Tasks started by the last span are already queued and get to
+            # open their spans first
+            asyncio.get_running_loop().call_soon(self._finish, trace)
+        except RuntimeError:
+            self._finish(trace)
+
+    def _finish(self, trace: _Trace) -> None:
+        if trace.open or trace.exported:
+            return
+        trace.exported = True
+        start = min(span.start_ns for span in trace.spans)
+        end = max(span.end_ns for span in trace.spans)
+        if not (trace.sampled or end - start >= self.slow_ns) or not self._writer:
+            return
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            logger.warning(f"Trace {trace.trace_id} dropped, the writer is behind.")
+
+    def _write(self) -> None:
+        """Writes queued traces, flushing whenever the queue runs empty."""
+        while True:
+            trace = self._queue.get()
+            if trace is None:
+                break
+            try:
+                self._file.write(json.dumps(self._to_otlp(trace)) + "\n")
+                if self._queue.empty():
+                    self._file.flush()
+            except OSError as e:
+                logger.error(f"Could not write trace {trace.trace_id}: {e}")
+        try:
+            self._file.flush()
+        except OSError as e:
+            logger.error(f"Could not flush traces: {e}")
+
+    def _to_otlp(self, trace: _Trace) -> dict:
+        spans = []
+        for span in trace.spans:
+            otlp_span = {
+                "traceId": trace.trace_id,
+                "spanId": span.span_id,
+                "name": span.name,
+                "kind": span.kind,
+                "startTimeUnixNano": str(span.start_ns),
+                "endTimeUnixNano": str(span.end_ns),
+                "attributes": [
+                    {"key": key, "value": _attribute_value(value)}
+                    for key, value in span.attributes.items()
+                ],
+            }
+            if span.parent_id:
+                otlp_span["parentSpanId"] = span.parent_id
+            if span.error:
+                otlp_span["status"] = {"code": STATUS_ERROR, "message": span.error}
+            spans.append(otlp_span)
+        return {
+            "resourceSpans": [
+                {
+                    "resource": self._resource,
+                    "scopeSpans": [{"scope": {"name": __name__}, "spans": spans}],
+                }
+            ]
+        }
+
+
+tracer = Tracer()
+
+
+def traced(name: str | None = None) -> Callable:
+    """Records each call of an async function as a span."""
+
+    def decorator(func: Callable) -> Callable:
+        span_name = name or f"{func.__module__}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return await func(*args, **kwargs)
+            with tracer.span(span_name):
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
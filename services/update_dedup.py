@@ -0,0 +1,66 @@
+from loguru import logger
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+KEY_PREFIX = "update"
+# A claim expires quickly if its replica dies mid-update, so a redelivery
+# can still be processed; a finished update is remembered for longer.
+PROCESSING_TTL = 60  # seconds
+DONE_TTL = 3600  # seconds
+PROCESSING = b"processing"
+DONE = b"done"
+
+
+class UpdateDeduplicator:
+    """
+    Makes sure each update_id is processed once across all replicas.
+
+    The first replica to receive an update claims it with SET NX, so a
+    redelivery by Telegram costs one Redis round trip wherever it lands.
+    """
+
+    def __init__(
+        self,
+        redis: Redis,
+        processing_ttl: int = PROCESSING_TTL,
+        done_ttl: int = DONE_TTL,
+    ):
+        self.redis = redis
+        self.processing_ttl = processing_ttl
+        self.done_ttl = done_ttl
+
+    @staticmethod
+    def _key(bot_id: int, update_id: int) -> str:
+        return f"{KEY_PREFIX}:{bot_id}:{update_id}"
+
+    async def claim(self, bot_id: int, update_id: int) -> bool:
+        """
+        Returns True if the update is new. Without Redis the update is let
+        through, a rare duplicate being better than a lost update.
+        """
+        try:
+            return bool(
+                await self.redis.set(
+                    self._key(bot_id, update_id),
+                    PROCESSING,
+                    nx=True,
+                    ex=self.processing_ttl,
+                )
+            )
+        except RedisError:
+            logger.exception(f"Could not claim update {update_id}, processing it.")
+            return True
+
+    async def complete(self, bot_id: int, update_id: int) -> None:
+        """Remembers a processed update for the longer TTL."""
+        try:
+            await self.redis.set(self._key(bot_id, update_id), DONE, ex=self.done_ttl)
+        except RedisError:
+            logger.exception(f"Could not mark update {update_id} as processed.")
+
+    async def release(self, bot_id: int, update_id: int) -> None:
+        """Drops a claim, e.g. when the update was refused and will be redelivered."""
+        try:
+            await self.redis.delete(self._key(bot_id, update_id))
+        except RedisError:
+            logger.exception(f"Could not release update {update_id}.")
@@ -0,0 +1,230 @@
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, Hashable
+
+from aiogram import Bot, Dispatcher
+from aiogram.dispatcher.event.bases import CancelHandler
+from aiogram.methods import TelegramMethod
+from aiogram.types import Update
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+from aiohttp import web
+from loguru import logger
+
+from .metrics import (
+    UPDATE_QUEUE_PENDING,
+    UPDATE_QUEUE_SECONDS,
+    UPDATES_DUPLICATE,
+    UPDATES_REJECTED,
+)
+from .tracing import KIND_SERVER, tracer
+from .update_dedup import UpdateDeduplicator
+
+WORKERS = 10
+MAX_PENDING = 1000
+# How long a webhook request may wait for queue space before Telegram is
+# told to redeliver the update later
+ENQUEUE_TIMEOUT = 10  # seconds
+DRAIN_TIMEOUT = 20  # seconds
+
+
+def ordering_key(update: Update) -> Hashable:
+    """
+    Returns the key whose updates must be processed in order: the chat, or
+    the user for events without a chat. Other updates need no ordering.
+    """
+    try:
+        event = update.event
+    except Exception:
+        return ("update", update.update_id)
+    chat = getattr(event, "chat", None)
+    if chat is None and getattr(event, "message", None) is not None:
+        chat = event.message.chat
+    if chat is not None:
+        return ("chat", chat.id)
+    user = getattr(event, "from_user", None)
+    if user is not None:
+        return ("user", user.id)
+    return ("update", update.update_id)
+
+
+class UpdateWorkerPool:
+    """
+    Processes updates on a fixed number of workers, in order per chat.
+
+    Each chat has its own queue, and a chat is handled by at most one worker
+    at a time, so dialog state changes never race. Workers take one update
+    per turn and put a busy chat back at the end of the line, so a chat with
+    a slow handler cannot starve the others. `submit()` waits while
+    `max_pending` updates are queued, which pushes back on Telegram instead
+    of buffering without limit.
+    """
+
+    def __init__(
+        self,
+        process: Callable[[Update, float], Awaitable[None]],
+        workers: int = WORKERS,
+        max_pending: int = MAX_PENDING,
+    ):
+        self.process = process
+        self.workers = workers
+        self.max_pending = max_pending
+        self._chats: dict[Hashable, deque[tuple[Update, float]]] = {}
+        self._ready: asyncio.Queue[Hashable] = asyncio.Queue()
+        self._space = asyncio.Semaphore(max_pending)
+        self._pending = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._tasks: list[asyncio.Task] = []
+        self._closed = False
+
+    @property
+    def pending(self) -> int:
+        """Updates queued or being processed."""
+        return self._pending
+
+    async def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        logger.info(
+            f"Update workers started ({self.workers} workers, "
+            f"up to {self.max_pending} pending updates)."
+        )
+
+    async def stop(self, timeout: float = DRAIN_TIMEOUT) -> None:
+        """
+        Refuses new updates, waits up to `timeout` for queued ones, then stops
+        the workers.
+        """
+        self._closed = True
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Stopping with {self._pending} updates unprocessed.")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, update: Update, timeout: float = ENQUEUE_TIMEOUT) -> bool:
+        """
+        Queues an update. Returns False if no space freed up in time or the
+        pool is stopping, so Telegram can redeliver it to another replica.
+        """
+        try:
+            await asyncio.wait_for(self._space.acquire(), timeout)
+        except asyncio.TimeoutError:
+            UPDATES_REJECTED.inc()
+            return False
+        if self._closed:
+            self._space.release()
+            UPDATES_REJECTED.inc()
+            return False
+        self._pending += 1
+        self._idle.clear()
+        UPDATE_QUEUE_PENDING.set(self._pending)
+
+        key = ordering_key(update)
+        queue = self._chats.get(key)
+        if queue is None:
+            self._chats[key] = deque([(update, time.perf_counter())])
+            self._ready.put_nowait(key)
+        else:
+            # The chat is queued or being processed, its worker will get to it
+            queue.append((update, time.perf_counter()))
+        return True
+
+    async def _work(self) -> None:
+        while True:
+            key = await self._ready.get()
+            queue = self._chats[key]
+            update, enqueued_at = queue.popleft()
+            waited = time.perf_counter() - enqueued_at
+            UPDATE_QUEUE_SECONDS.observe(waited)
+            try:
+                await self.process(update, waited)
+            except Exception:
+                logger.exception(f"Failed to process update {update.update_id}.")
+            finally:
+                if queue:
+                    self._ready.put_nowait(key)
+                else:
+                    del self._chats[key]
+                self._pending -= 1
+                UPDATE_QUEUE_PENDING.set(self._pending)
+                if not self._pending:
+                    self._idle.set()
+                self._space.release()
+
+
+class QueuedRequestHandler(SimpleRequestHandler):
+    """
+    A webhook handler that acknowledges each update at once and hands it to
+    an `UpdateWorkerPool`. The pool is started and drained with the app.
+    With a deduplicator, updates Telegram redelivers are acknowledged
+    without being processed again.
+    """
+
+    def __init__(
+        self,
+        dispatcher: Dispatcher,
+        bot: Bot,
+        workers: int = WORKERS,
+        max_pending: int = MAX_PENDING,
+        dedup: UpdateDeduplicator | None = None,
+        **data,
+    ):
+        super().__init__(dispatcher, bot, handle_in_background=True, **data)
+        self.pool = UpdateWorkerPool(self._process, workers, max_pending)
+        self.dedup = dedup
+
+    def register(self, app: web.Application, /, path: str, **kwargs) -> None:
+        app.on_startup.append(self._start_pool)
+        # Runs before the parent's shutdown hook closes the bot session
+        app.on_shutdown.append(self._stop_pool)
+        super().register(app, path=path, **kwargs)
+
+    async def _start_pool(self, app: web.Application) -> None:
+        await self.pool.start()
+
+    async def _stop_pool(self, app: web.Application) -> None:
+        await self.pool.stop()
+
+    async def _handle_request_background(
+        self, bot: Bot, request: web.Request
+    ) -> web.Response:
+        raw_update = await request.json(loads=bot.session.json_loads)
+        update_id = raw_update.get("update_id")
+        if self.dedup and not await self.dedup.claim(bot.id, update_id):
+            UPDATES_DUPLICATE.inc()
+            logger.debug(f"Update {update_id} was already received, skipped.")
+            return web.json_response({}, dumps=bot.session.json_dumps)
+
+        update = Update.model_validate(raw_update, context={"bot": bot})
+        if not await self.pool.submit(update):
+            logger.warning(
+                f"Update {update_id} refused, the queue is full or stopping."
+            )
+            if self.dedup:
+                await self.dedup.release(bot.id, update_id)
+            # Telegram redelivers the update later
+            return web.Response(text="Update queue is unavailable", status=503)
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    async def _process(self, update: Update, waited: float) -> None:
+        with tracer.span("update", kind=KIND_SERVER, update_id=update.update_id):
+            tracer.record("queue", waited)
+            try:
+                result = await self.dispatcher.feed_update(
+                    self.bot, update, **self.data
+                )
+            except CancelHandler:
+                # Dropped on purpose, e.g. by the event isolation
+                return
+            else:
+                if isinstance(result, TelegramMethod):
+                    await self.dispatcher.silent_call_request(
+                        bot=self.bot, result=result
+                    )
+            finally:
+                if self.dedup:
+                    await self.dedup.complete(self.bot.id, update.update_id)
@@ -0,0 +1,170 @@
+import dataclasses
+import datetime
+import json
+import time
+from collections import OrderedDict
+
+from redis.asyncio import Redis
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import Booking, Faculty, User
+
+from .invalidation import invalidation_bus
+from .tracing import traced
+
+PROFILE_TTL = 3600  # seconds
+# Unregistered users are cached briefly in Redis only; registration
+# overwrites the marker
+MISSING_TTL = 60  # seconds
+# Changes evict local copies on every replica, the TTL only bounds the damage
+# of a missed eviction
+LOCAL_TTL = 10  # seconds
+LOCAL_SIZE = 2048
+# Versioned, so profiles cached before a field was added are not read
+KEY_PREFIX = "profile:v2"
+MISSING_MARKER = b"-"
+PROFILES_TOPIC = "profiles"
+
+
+@dataclasses.dataclass(frozen=True)
+class UserProfile:
+    """The fields of a user that handlers need on every update."""
+
+    user_id: int
+    telegram_id: int
+    lang: str | None
+    window: int | None
+    year: int | None
+    is_admin: bool
+    is_signed_up: bool
+    booking_datetime: datetime.datetime | None = None
+    # The window the booking was made at, which may differ from `window`
+    booking_window: int | None = None
+
+    def to_json(self) -> str:
+        data = dataclasses.asdict(self)
+        if self.booking_datetime:
+            data["booking_datetime"] = self.booking_datetime.isoformat()
+        return json.dumps(data)
+
+    @classmethod
+    def from_json(cls, raw: bytes | str) -> "UserProfile":
+        data = json.loads(raw)
+        if data["booking_datetime"]:
+            data["booking_datetime"] = datetime.datetime.fromisoformat(
+                data["booking_datetime"]
+            )
+        return cls(**data)
+
+
+async def load_profile(session: AsyncSession, telegram_id: int) -> UserProfile | None:
+    """Loads a user profile from the primary database in a single query."""
+    stmt = (
+        select(
+            User,
+            Faculty.window_number,
+            Booking.booking_datetime,
+            Booking.window_number,
+        )
+        .outerjoin(Faculty, User.faculty_id == Faculty.faculty_id)
+        .outerjoin(Booking, Booking.user_id == User.user_id)
+        .where(User.telegram_id == telegram_id)
+        # Cached for PROFILE_TTL, so a lagging replica must not be read
+        .execution_options(use_primary=True)
+    )
+    row = (await session.execute(stmt)).first()
+    if not row:
+        return None
+    user, window, booking_datetime, booking_window = row
+    return UserProfile(
+        user_id=user.user_id,
+        telegram_id=user.telegram_id,
+        lang=user.lang,
+        window=window,
+        year=user.year,
+        is_admin=user.is_admin,
+        is_signed_up=user.is_signed_up,
+        booking_datetime=booking_datetime,
+        booking_window=booking_window,
+    )
+
+
+class UserProfileCache:
+    """
+    Two-level cache of user profiles: a small in-process LRU in front of Redis.
+
+    Profiles are written through by every code path that changes them
+    (registration, booking, cancellation, /admin) and loaded from the
+    database on a miss. Writes evict the local copies of other replicas
+    through the invalidation bus. Unregistered users are never cached
+    locally, so a registration made on another replica is seen at once.
+    """
+
+    def __init__(
+        self,
+        redis: Redis,
+        ttl: int = PROFILE_TTL,
+        local_ttl: float = LOCAL_TTL,
+        local_size: int = LOCAL_SIZE,
+    ):
+        self.redis = redis
+        self.ttl = ttl
+        self.local_ttl = local_ttl
+        self.local_size = local_size
+        self._local: OrderedDict[int, tuple[UserProfile, float]] = OrderedDict()
+        invalidation_bus.subscribe(PROFILES_TOPIC, self._evict)
+
+    @staticmethod
+    def _key(telegram_id: int) -> str:
+        return f"{KEY_PREFIX}:{telegram_id}"
+
+    @traced()
+    async def get(self, session: AsyncSession, telegram_id: int) -> UserProfile | None:
+        """Returns a user's profile, or None if the user is not registered."""
+        cached = self._local.get(telegram_id)
+        if cached and cached[1] > time.monotonic():
+            self._local.move_to_end(telegram_id)
+            return cached[0]
+
+        raw = await self.redis.get(self._key(telegram_id))
+        if raw == MISSING_MARKER:
+            return None
+        if raw is not None:
+            profile = UserProfile.from_json(raw)
+            self._remember(telegram_id, profile)
+            return profile
+
+        profile = await load_profile(session, telegram_id)
+        if profile:
+            await self.redis.set(self._key(telegram_id), profile.to_json(), ex=self.ttl)
+            self._remember(telegram_id, profile)
+        else:
+            await self.redis.set(self._key(telegram_id), MISSING_MARKER, ex=MISSING_TTL)
+        return profile
+
+    async def store(self, profile: UserProfile) -> None:
+        """Writes a changed profile through to Redis and the local cache."""
+        await self.redis.set(
+            self._key(profile.telegram_id), profile.to_json(), ex=self.ttl
+        )
+        await invalidation_bus.publish(PROFILES_TOPIC, profile.telegram_id)
+        self._remember(profile.telegram_id, profile)
+
+    async def invalidate(self, telegram_id: int) -> None:
+        """Drops a profile, e.g. after a change made outside the bot."""
+        await self.redis.delete(self._key(telegram_id))
+        await invalidation_bus.publish(PROFILES_TOPIC, telegram_id)
+
+    def _evict(self, telegram_id: int | None = None) -> None:
+        """Drops one local copy, or all of them when called without an id."""
+        if telegram_id is None:
+            self._local.clear()
+        else:
+            self._local.pop(telegram_id, None)
+
+    def _remember(self, telegram_id: int, profile: UserProfile) -> None:
+        self._local[telegram_id] = (profile, time.monotonic() + self.local_ttl)
+        self._local.move_to_end(telegram_id)
+        while len(self._local) > self.local_size:
+            self._local.popitem(last=False)
@@ -0,0 +1,56 @@
+import hashlib
+import json
+
+from aiogram import Bot
+from loguru import logger
+from redis.asyncio import Redis
+
+KEY_PREFIX = "webhook"
+LOCK_TTL = 30  # seconds
+
+
+def webhook_checksum(url: str, allowed_updates: list[str] | None) -> str:
+    """Fingerprints the webhook settings, to tell whether they changed."""
+    settings = {"url": url, "allowed_updates": sorted(allowed_updates or [])}
+    return hashlib.sha256(json.dumps(settings).encode()).hexdigest()
+
+
+async def ensure_webhook(
+    bot: Bot,
+    redis: Redis,
+    url: str,
+    allowed_updates: list[str] | None = None,
+) -> bool:
+    """
+    Registers the webhook unless it is already set with the same settings.
+
+    Every replica calls this on startup. The settings last registered are
+    kept in Redis as a checksum, so the webhook is only set when they
+    changed or Telegram lost it, and then by a single replica holding a
+    short lock. Pending updates are never dropped.
+
+    Returns:
+        True if this replica registered the webhook.
+    """
+    checksum = webhook_checksum(url, allowed_updates)
+    checksum_key = f"{KEY_PREFIX}:{bot.id}:checksum"
+
+    if await redis.get(checksum_key) == checksum.encode():
+        info = await bot.get_webhook_info()
+        if info.url == url:
+            logger.info(f"Webhook already set to {url}")
+            return False
+
+    lock_key = f"{KEY_PREFIX}:{bot.id}:lock"
+    if not await redis.set(lock_key, 1, nx=True, ex=LOCK_TTL):
+        logger.info("Webhook is being set by another replica.")
+        return False
+    try:
+        await bot.set_webhook(
+            url=url, allowed_updates=allowed_updates, drop_pending_updates=False
+        )
+        await redis.set(checksum_key, checksum)
+    finally:
+        await redis.delete(lock_key)
+    logger.info(f"Webhook set to {url}")
+    return True